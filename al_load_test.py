@@ -0,0 +1,76 @@
+import http.client
+import json
+import numpy as np
+import pickle
+import socket
+import sys
+import threading
+import time
+from al_service import QueryService, create_server
+
+
+def run_client(port, target, batch_size, num_requests, latencies):
+    """
+    Simulated labeler: ask for a batch, label it with the known targets
+    and send the labels back, timing every request.
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.connect()
+    connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    for i in range(num_requests):
+        start = time.time()
+        connection.request("GET", "/next?count={}".format(batch_size))
+        positions = json.loads(connection.getresponse().read())["positions"]
+        latencies["next"].append(time.time() - start)
+        if len(positions) == 0:
+            break
+        body = json.dumps({"positions": positions, "targets": [float(target[pos, 0]) for pos in positions]})
+        start = time.time()
+        connection.request("POST", "/labels", body, {"Content-Type": "application/json"})
+        connection.getresponse().read()
+        latencies["labels"].append(time.time() - start)
+    connection.close()
+
+
+def main():
+    """
+    Start a service in this process and hit it from several client
+    threads.  Pass a port to test a service that is already running.
+    """
+    name = sys.argv[1] if len(sys.argv) > 1 else "concrete"
+    method = sys.argv[2] if len(sys.argv) > 2 else "qbc"
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    num_clients = 4
+    num_requests = 50
+    batch_size = 5
+    with open("data/{}.dat".format(name), "rb") as infile:
+        target = pickle.loads(infile.read())["target"]
+    server = None
+    if port is None:
+        server = create_server(QueryService(name, method), 0)
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    latencies = {"next": [], "labels": []}
+    threads = [threading.Thread(target=run_client, args=(port, target, batch_size, num_requests, latencies))
+        for i in range(num_clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+
+    num = len(latencies["next"]) + len(latencies["labels"])
+    print("{} {}: {} requests in {:.2f}s ({:.0f} requests/s)".format(name, method, num, duration, num / duration))
+    for key in ["next", "labels"]:
+        x = 1000 * np.array(latencies[key])
+        print("{}\tp50 {:.2f}ms\tp95 {:.2f}ms\tp99 {:.2f}ms".format(key,
+            np.percentile(x, 50), np.percentile(x, 95), np.percentile(x, 99)))
+    if server is not None:
+        print("rmse {:.4f}".format(server.service.get_status()["rmse"]))
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import numpy as np
+import random
+import sys
+import threading
+from ssbase import SemiSupervisedBase
+from urllib.parse import parse_qs, urlparse
+
+
+# Methods whose scores the service can keep up to date.
+METHODS = ["random", "greedy", "qbc", "bemcm"]
+
+
+class QueryService:
+    """
+    Keeps a data set, its model and committee in memory and answers
+    "add labels" and "next batch" requests.  New labels update the models
+    incrementally (one SGD pass over the new points; committee members see
+    each new point a Poisson(1) number of times, which is online
+    bagging) and the pool scores are only recomputed when the models
+    changed.  The split and the initial models only depend on seed.
+    """
+
+    def __init__(self, name, method = "qbc", seed = 555):
+        if method not in METHODS:
+            raise ValueError("Method '{}' is not supported by the service.".format(method))
+        self.learner = SemiSupervisedBase(name, method)
+        self.method = method
+        self.lock = threading.Lock()
+        self.random = np.random.RandomState(seed)
+        self.learner.seed = seed
+        random.seed(seed)
+        np.random.seed(seed)
+        self.learner.start_run()
+        X = self.learner.data["data"]
+        # The first fit only initializes the weights.
+        self.learner.train()
+        self.learner.train()
+        if method in ["qbc", "bemcm"]:
+            self.learner.train_committee()
+            self.learner.train_committee()
+        self.is_pool = np.zeros(X.shape[0], dtype=bool) # Points that can be selected.
+        self.is_pool[self.learner.unlabeled_pos_list] = True
+        self.is_pending = np.zeros(X.shape[0], dtype=bool) # Points handed out and waiting for a label.
+        self.order = self.random.permutation(X.shape[0]).astype(float) # Scores for random selection.
+        self.min_dist = None
+        if method == "greedy":
+            self.min_dist = self.learner.score_greedy(X, X[self.learner.labeled_pos_list])
+        self.scores = None # Cached scores of every point, None when they need recomputing.
+
+    def add_labels(self, positions, targets):
+        """
+        Add labels and update the models with them.  Only points that were
+        handed out by next_batch and are still waiting for a label are
+        accepted.
+
+        Args:
+            positions - Positions of the labeled points.
+            targets - Their target values.
+        Return:
+            Number of labeled points.
+        """
+        with self.lock:
+            positions = np.asarray(positions)
+            targets = np.asarray(targets, dtype=float)
+            if positions.ndim != 1 or targets.shape != positions.shape:
+                raise ValueError("Positions and targets must be lists of the same length.")
+            if positions.size > 0 and not np.issubdtype(positions.dtype, np.integer):
+                raise ValueError("Positions must be integers.")
+            positions = positions.astype(np.int64)
+            if np.any((positions < 0) | (positions >= self.is_pool.size)):
+                raise ValueError("Positions are out of range.")
+            if np.unique(positions).size != positions.size:
+                raise ValueError("Positions are repeated.")
+            if not np.all(self.is_pool[positions] & self.is_pending[positions]):
+                raise ValueError("Positions were not handed out or are already labeled.")
+            if not np.all(np.isfinite(targets)):
+                raise ValueError("Targets must be finite numbers.")
+            X = self.learner.data["data"]
+            y = self.learner.data["target"]
+            y[positions, 0] = targets
+            self.learner.labeled_pos_list.extend(positions.tolist())
+            self.is_pool[positions] = False
+            self.is_pending[positions] = False
+            self.learner.model.fit(X[positions], y[positions])
+            for model in self.learner.qbc_models:
+                bootstrap = np.repeat(positions, self.random.poisson(1, positions.size))
+                if bootstrap.size > 0:
+                    model.fit(X[bootstrap], y[bootstrap])
+            if self.min_dist is not None:
+                np.minimum(self.min_dist, self.learner.score_greedy(X, X[positions]), out=self.min_dist)
+            if self.method != "random":
+                self.scores = None
+            return len(self.learner.labeled_pos_list)
+
+    def next_batch(self, count):
+        """
+        Select the best pool points that were not handed out yet.
+
+        Args:
+            count - Number of points to select.
+        Return:
+            List of positions from best to worst.
+        """
+        with self.lock:
+            if self.scores is None:
+                self.scores = self.get_scores()
+            candidates = np.flatnonzero(self.is_pool & ~self.is_pending)
+            count = min(count, candidates.size)
+            if count == 0:
+                return []
+            scores = self.scores[candidates]
+            best = np.argpartition(-scores, count - 1)[:count]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            positions = candidates[best]
+            self.is_pending[positions] = True
+            return positions.tolist()
+
+    def get_scores(self):
+        X = self.learner.data["data"]
+        if self.method == "random":
+            return self.order
+        elif self.method == "greedy":
+            return self.min_dist
+        elif self.method == "qbc":
+            return self.learner.score_qbc(X)
+        elif self.method == "bemcm":
+            return self.learner.score_bemcm(X)
+        raise ValueError("Method '{}' is not supported by the service.".format(self.method))
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "name": self.learner.name,
+                "method": self.method,
+                "labeled": len(self.learner.labeled_pos_list),
+                "pool": int(self.is_pool.sum()),
+                "pending": int(self.is_pending.sum()),
+                "rmse": self.learner.evaluate(),
+            }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP:
+        GET /next?count=k - {"positions": [...]}
+        POST /labels {"positions": [...], "targets": [...]} - {"labeled": n}
+            (400 for bad JSON or positions that were not handed out)
+        GET /status - counts and the current test rmse.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/next":
+            try:
+                count = int(parse_qs(url.query).get("count", ["1"])[0])
+            except ValueError:
+                count = -1
+            if count < 0:
+                self.send_json({"error": "count must be a non-negative integer"}, 400)
+                return
+            try:
+                positions = self.server.service.next_batch(count)
+            except ValueError as error:
+                self.send_json({"error": str(error)}, 400)
+                return
+            self.send_json({"positions": positions})
+        elif url.path == "/status":
+            self.send_json(self.server.service.get_status())
+        else:
+            self.send_json({"error": "unknown path"}, 404)
+
+    def do_POST(self):
+        if self.path != "/labels":
+            self.send_json({"error": "unknown path"}, 404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            # The body cannot be skipped, so the connection cannot be reused.
+            self.close_connection = True
+            self.send_json({"error": "bad Content-Length"}, 400)
+            return
+        try:
+            body = json.loads(self.rfile.read(length))
+            labeled = self.server.service.add_labels(body["positions"], body["targets"])
+        except (ValueError, KeyError, TypeError) as error:
+            self.send_json({"error": str(error)}, 400)
+            return
+        self.send_json({"labeled": labeled})
+
+    def send_json(self, value, code = 200):
+        body = json.dumps(value).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(service, port = 8765):
+    """
+    Create an HTTP server for the service that only listens on localhost.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), ServiceHandler)
+    server.service = service
+    return server
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "concrete"
+    method = sys.argv[2] if len(sys.argv) > 2 else "qbc"
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 8765
+    server = create_server(QueryService(name, method), port)
+    print("Serving {} {} on http://127.0.0.1:{}".format(name, method, port))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
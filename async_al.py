@@ -0,0 +1,121 @@
+import asyncio
+import numpy as np
+import os
+import random
+from oracle import SimulatedOracle
+from ssbase import SemiSupervisedBase
+import time
+
+
+class AsyncActiveLearner(SemiSupervisedBase):
+    """
+    Active learning loop where labels come from an asynchronous oracle.
+    Selected points are sent to the oracle concurrently and the loop does
+    not wait for a batch to finish: the next batch is selected as soon as
+    the pipeline has room, while the remaining labels are still in flight,
+    and the model is refit on the whole labeled set every time a batch
+    worth of labels has arrived.
+    """
+
+    def __init__(self, name, method = "random"):
+        SemiSupervisedBase.__init__(self, name, method)
+        self.concurrency = 16 # Maximum number of oracle requests in flight.
+        self.pipeline_depth = 2 # Number of batches that can be waiting for labels.
+        self.history = [] # (seconds, labeled count, rmse) after every update.
+
+    async def run(self, oracle):
+        """
+        Label num_iterations - 1 batches through the oracle.
+
+        Args:
+            oracle - Oracle that answers the label requests.
+        Return:
+            Dictionary with the labeled count, elapsed seconds, throughput
+            in labeled points per hour and the final rmse.
+        """
+        self.start_run()
+        # Hide every target the oracle has not answered yet.
+        target = self.data["target"]
+        self.data["target"] = target.copy()
+        self.data["target"][self.unlabeled_pos_list] = np.nan
+        try:
+            return await self.label_batches(oracle)
+        finally:
+            self.data["target"] = target
+
+    async def label_batches(self, oracle):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start_time = time.time()
+        in_flight = set()
+        num_batches = 0
+        num_labeled = 0
+        num_unfit = 0 # Labels that arrived since the model was last fit.
+        # The first fit only initializes the weights.
+        self.train()
+        self.history = [(0.0, len(self.labeled_pos_list), self.train())]
+        while True:
+            # Select new batches with the current model while there is room.
+            while num_batches < self.num_iterations - 1 and len(in_flight) <= self.batch_count * (self.pipeline_depth - 1):
+                count = len(self.labeled_pos_list)
+                self.update_labeled()
+                # Selected points only join the labeled set once answered.
+                batch = self.labeled_pos_list[count:]
+                del self.labeled_pos_list[count:]
+                for pos in batch:
+                    in_flight.add(asyncio.ensure_future(self.request_label(oracle, semaphore, pos)))
+                num_batches += 1
+            if len(in_flight) == 0:
+                break
+            (done, in_flight) = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                (pos, label) = task.result()
+                self.data["target"][pos, 0] = label
+                self.labeled_pos_list.append(pos)
+            num_labeled += len(done)
+            num_unfit += len(done)
+            if num_unfit >= self.batch_count or len(in_flight) == 0:
+                # Refit on every label so far, like a synchronous loop does.
+                self.history.append((time.time() - start_time, len(self.labeled_pos_list), self.train()))
+                num_unfit = 0
+        duration = time.time() - start_time
+        return {
+            "labeled": num_labeled,
+            "seconds": duration,
+            "per_hour": 3600.0 * num_labeled / duration,
+            "rmse": self.history[-1][2],
+        }
+
+    async def request_label(self, oracle, semaphore, pos):
+        async with semaphore:
+            label = await oracle.label(pos)
+        return (pos, label)
+
+
+def main():
+    """
+    Measure labeled points per hour for different oracle latencies and
+    concurrency limits with a simulated oracle.
+    """
+    names = ["concrete", "housing"]
+    if not os.path.isdir("results"):
+        os.mkdir("results")
+    with open("results/async_al.txt", "w") as outfile:
+        outfile.write("name\tmethod\tlatency\tconcurrency\tlabeled\tseconds\tper_hour\trmse\n")
+        for name in names:
+            for method in ["random", "qbc"]:
+                for latency in [0.01, 0.05]:
+                    for concurrency in [1, 8, 64]:
+                        s = AsyncActiveLearner(name, method)
+                        s.concurrency = concurrency
+                        random.seed(555)
+                        np.random.seed(555)
+                        oracle = SimulatedOracle(s.data["target"].copy(), latency, latency / 2, seed=555)
+                        report = asyncio.run(s.run(oracle))
+                        line = "{}\t{}\t{}\t{}\t{}\t{:.2f}\t{:.0f}\t{:.4f}".format(name, method, latency,
+                            concurrency, report["labeled"], report["seconds"], report["per_hour"], report["rmse"])
+                        print(line)
+                        outfile.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
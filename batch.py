@@ -0,0 +1,162 @@
+import json
+from multiprocessing import Pool
+import numpy as np
+import os
+import random
+import subprocess
+import sys
+import time
+from ssbase import SemiSupervisedBase
+
+
+class BatchRunner:
+    """
+    Run many small (name, method, run) jobs in one process.  Each data set
+    is loaded once and its learner (data, precomputation cache, memory
+    maps) is shared by every job on it; a job only brings its method, its
+    seed and its committee.  The committee of a method is kept from one run
+    to the next like in SemiSupervisedBase.get_runs, so the runs of a
+    method have to go to the same runner in run order.
+    """
+
+    def __init__(self, num_iterations = None):
+        self.num_iterations = num_iterations # Loops per run (None keeps the SemiSupervisedBase default).
+        self.learners = {} # Learner of each data set.
+        self.committees = {} # Committee of each (name, method).
+
+    def get_learner(self, name):
+        if name not in self.learners:
+            learner = SemiSupervisedBase(name, "random")
+            if self.num_iterations is not None:
+                learner.num_iterations = self.num_iterations
+            self.learners[name] = learner
+        return self.learners[name]
+
+    def run(self, job):
+        """
+        Run one job.
+
+        Args:
+            job - Tuple of the data set name, the method and the run.
+        Return:
+            Dictionary with the job, its percent labeled and rmse per loop
+            and why it stopped.
+        """
+        (name, method, run) = job
+        s = self.get_learner(name)
+        s.method = method
+        s.qbc_models = self.committees.setdefault((name, method), [])
+        s.run_index = run
+        s.seed = run * 555
+        random.seed(s.seed)
+        np.random.seed(s.seed)
+        (percent_labeled, rmse) = s.process()
+        return {
+            "name": name,
+            "method": method,
+            "run": run,
+            "percent_labeled": percent_labeled.tolist(),
+            "rmse": rmse.tolist(),
+            "stop_reason": s.stop_reason,
+        }
+
+
+def run_batch(jobs, num_iterations = None):
+    runner = BatchRunner(num_iterations)
+    return [runner.run(job) for job in jobs]
+
+
+def pack(jobs, num_batches):
+    """
+    Pack jobs into batches.  The runs of a (name, method) stay together and
+    in order, data sets are kept together where possible, and the batches
+    get about the same number of jobs.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job[:2], []).append(job)
+    groups = sorted(groups.values(), key=lambda group: (group[0][0], group[0][1]))
+    batches = [[] for i in range(num_batches)]
+    size = int(np.ceil(len(jobs) / num_batches))
+    i = 0
+    for group in groups:
+        if len(batches[i]) >= size and i + 1 < num_batches:
+            i += 1
+        batches[i].extend(sorted(group, key=lambda job: job[2]))
+    return [batch for batch in batches if len(batch) > 0]
+
+
+def run_batched(jobs, processes = None, num_iterations = None):
+    """
+    Run the jobs packed into one batch per worker process.
+
+    Return:
+        Results in the order of the batches.
+    """
+    processes = processes or os.cpu_count()
+    batches = pack(jobs, processes)
+    with Pool(processes) as pool:
+        results = pool.starmap(run_batch, [(batch, num_iterations) for batch in batches])
+    return [result for batch in results for result in batch]
+
+
+def run_per_process(jobs, processes = None, num_iterations = None):
+    """
+    Run every job in a new interpreter, as many at a time as there are
+    cores.  Committees start empty in every process, so for committee
+    methods the runs after the first do not match get_runs.
+    """
+    processes = processes or os.cpu_count()
+    results = []
+    pending = list(jobs)
+    running = []
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < processes:
+            (name, method, run) = pending.pop(0)
+            args = [sys.executable, __file__, name, method, str(run)]
+            if num_iterations is not None:
+                args.append(str(num_iterations))
+            running.append(subprocess.Popen(args, stdout=subprocess.PIPE, text=True))
+        process = running.pop(0)
+        output = process.communicate()[0]
+        results.append(json.loads(output.strip().split("\n")[-1]))
+    return results
+
+
+def main():
+    """
+    With arguments run one job and print its result as JSON (used by
+    run_per_process).  Without arguments compare jobs per second of the
+    batched mode against one job per process on the small data sets.
+    """
+    if len(sys.argv) > 1:
+        num_iterations = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        result = run_batch([(sys.argv[1], sys.argv[2], int(sys.argv[3]))], num_iterations)[0]
+        print(json.dumps(result))
+        return
+
+    names = ["forestfires", "pm10", "housing", "cps"]
+    methods = ["random", "bemcm", "qbc", "greedy"]
+    num_runs = 5
+    jobs = [(name, method, run) for name in names for method in methods for run in range(num_runs)]
+    if not os.path.isdir("results"):
+        os.mkdir("results")
+    with open("results/bench_batch.txt", "w") as outfile:
+        outfile.write("mode\tjobs\tseconds\tjobs_per_second\n")
+        for (mode, function) in [("per_process", run_per_process), ("batched", run_batched)]:
+            start = time.time()
+            results = function(jobs)
+            duration = time.time() - start
+            line = "{}\t{}\t{:.2f}\t{:.2f}".format(mode, len(results), duration, len(results) / duration)
+            print(line)
+            outfile.write(line + "\n")
+    with open("results/batch_jobs.tsv", "w") as outfile:
+        outfile.write("name\tmethod\trun\titeration\tpercent_labeled\trmse\tstop_reason\n")
+        for result in results:
+            for (j, rmse) in enumerate(result["rmse"]):
+                outfile.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(result["name"], result["method"], result["run"],
+                    j, result["percent_labeled"][j], rmse, result["stop_reason"]))
+
+
+if __name__ == "__main__":
+    main()
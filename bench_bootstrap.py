@@ -0,0 +1,51 @@
+from bootstrap import Bootstrap
+import numpy as np
+import os
+import pickle
+import random
+from sklearn.utils import resample
+import time
+
+
+def main():
+    """
+    Time drawing and gathering the committee bootstraps of one loop with
+    sklearn resample against the Generator backed Bootstrap.
+    """
+    names = ["concrete", "housing", "redwine", "whitewine"]
+    num_committee = 8
+    num_repeats = 200
+    names = [name for name in names if os.path.isfile("data/{}.dat".format(name))]
+    if not os.path.isdir("results"):
+        os.mkdir("results")
+    with open("results/bench_bootstrap.txt", "w") as outfile:
+        outfile.write("name\tlabeled\tsklearn_ms\tgenerator_ms\tspeedup\n")
+        for name in names:
+            with open("data/{}.dat".format(name), "rb") as infile:
+                data = pickle.loads(infile.read())
+            X = np.ascontiguousarray(data["data"])
+            y = np.ascontiguousarray(data["target"])
+            for fraction in [0.1, 0.5]:
+                pos_list = random.sample(range(X.shape[0]), int(X.shape[0] * fraction))
+                start = time.time()
+                for j in range(num_repeats):
+                    for i in range(num_committee):
+                        sample = resample(pos_list, random_state=random.randrange(1000000))
+                        X[sample]
+                        y[sample]
+                sklearn_time = (time.time() - start) / num_repeats
+                bootstrap = Bootstrap(555)
+                start = time.time()
+                for j in range(num_repeats):
+                    for sample in bootstrap.get_indices(pos_list, num_committee):
+                        bootstrap.gather("data", X, sample)
+                        bootstrap.gather("target", y, sample)
+                generator_time = (time.time() - start) / num_repeats
+                line = "{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}".format(name, len(pos_list), 1000 * sklearn_time,
+                    1000 * generator_time, sklearn_time / generator_time)
+                print(line)
+                outfile.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
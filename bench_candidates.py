@@ -0,0 +1,54 @@
+import numpy as np
+import os
+from ssbase import SemiSupervisedBase
+import time
+
+
+def main():
+    """
+    Compare approximate candidate sampling against exact selection.
+    For each setting we report the wall time and how far the average
+    rmse curve drifts from the curve of exact selection.
+    """
+    names = ["concrete", "housing", "redwine", "whitewine"]
+    methods = ["bemcm", "qbc", "greedy"]
+    settings = [
+        (None, "random", 1),
+        (100, "random", 1),
+        (100, "stratified", 1),
+        (300, "random", 1),
+        (300, "random", 3),
+        (300, "stratified", 3),
+    ]
+    num_runs = 3
+    names = [name for name in names if os.path.isfile("data/{}.dat".format(name))]
+    if not os.path.isdir("results"):
+        os.mkdir("results")
+    with open("results/bench_candidates.txt", "w") as outfile:
+        outfile.write("name\tmethod\tcandidates\tmode\trefresh\tseconds\tspeedup\tmax_rmse_drift\tfinal_rmse\n")
+        for name in names:
+            for method in methods:
+                exact_time = None
+                exact_curve = None
+                for (count, mode, refresh) in settings:
+                    s = SemiSupervisedBase(name, method)
+                    s.num_runs = num_runs
+                    s.candidate_count = count
+                    s.candidate_mode = mode
+                    s.candidate_refresh = refresh
+                    start = time.time()
+                    (_, rmse_list) = s.get_runs()
+                    duration = time.time() - start
+                    curve = rmse_list.mean(axis=0)
+                    if count is None:
+                        exact_time = duration
+                        exact_curve = curve
+                    line = "{}\t{}\t{}\t{}\t{}\t{:.2f}\t{:.1f}\t{:.4f}\t{:.4f}".format(name, method,
+                        "all" if count is None else count, mode, refresh, duration,
+                        exact_time / duration, np.abs(curve - exact_curve).max(), curve[-1])
+                    print(line)
+                    outfile.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
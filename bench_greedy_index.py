@@ -0,0 +1,64 @@
+import numpy as np
+import os
+import random
+from labeled_index import LabeledIndex
+from ssbase import SemiSupervisedBase
+import time
+
+
+def main():
+    """
+    Compare tree indexed greedy selection against brute force.  The
+    first table runs greedy on the low dimensional data sets, the second
+    times a single nearest labeled query on synthetic pools.
+    """
+    if not os.path.isdir("results"):
+        os.mkdir("results")
+    with open("results/bench_greedy_index.txt", "w") as outfile:
+        outfile.write("name\tindex\tseconds\tspeedup\tsame_labeled\tfinal_rmse\n")
+        for name in ["concrete", "pm10", "housing"]:
+            brute_time = None
+            brute_labeled = None
+            for (index, chunk_size) in [("brute", None), ("brute", 4096), ("kdtree", None), ("balltree", None)]:
+                s = SemiSupervisedBase(name, "greedy")
+                s.greedy_index = index
+                s.chunk_size = chunk_size
+                random.seed(555)
+                np.random.seed(555)
+                start = time.time()
+                (_, rmse) = s.process()
+                duration = time.time() - start
+                if brute_time is None:
+                    brute_time = duration
+                    brute_labeled = set(s.labeled_pos_list)
+                same = 1.0 * len(brute_labeled & set(s.labeled_pos_list)) / len(brute_labeled)
+                label = index if chunk_size is None else "{} chunked".format(index)
+                line = "{}\t{}\t{:.3f}\t{:.1f}\t{:.3f}\t{:.4f}".format(name, label, duration,
+                    brute_time / duration, same, rmse[-1])
+                print(line)
+                outfile.write(line + "\n")
+
+        outfile.write("\npool\tlabeled\tdim\tbrute_seconds\tkdtree_seconds\tspeedup\n")
+        rng = np.random.RandomState(555)
+        s = SemiSupervisedBase("concrete", "greedy")
+        for count in [10000, 50000, 100000]:
+            dim = 8
+            X = rng.rand(count, dim)
+            labeled_count = count // 10
+            start = time.time()
+            brute = s.score_greedy(X[labeled_count:], X[:labeled_count])
+            brute_time = time.time() - start
+            start = time.time()
+            index = LabeledIndex("kdtree")
+            index.add(X[:labeled_count])
+            tree = index.query(X[labeled_count:])
+            tree_time = time.time() - start
+            assert np.allclose(brute, tree)
+            line = "{}\t{}\t{}\t{:.3f}\t{:.3f}\t{:.1f}".format(count, labeled_count, dim,
+                brute_time, tree_time, brute_time / tree_time)
+            print(line)
+            outfile.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
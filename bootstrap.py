@@ -0,0 +1,52 @@
+import numpy as np
+from scipy import sparse
+
+
+class Bootstrap:
+    """
+    Bootstrap samples for a committee drawn from a NumPy Generator.  All
+    the samples of a loop come from one vectorized call, and the gathered
+    rows are written into buffers that are reused while the labeled set
+    keeps its size.
+    """
+
+    def __init__(self, seed = None):
+        self.generator = np.random.default_rng(seed)
+        self.buffers = {} # Gather buffers by name.
+
+    def get_indices(self, pos_list, num_sets, n_samples = None):
+        """
+        Draw num_sets bootstrap samples of the positions.
+
+        Args:
+            pos_list - Positions to sample from.
+            num_sets - Number of samples.
+            n_samples - Size of each sample (None uses the size of pos_list).
+        Return:
+            Matrix with one sample of positions per row.
+        """
+        pos_list = np.asarray(pos_list, dtype=np.int64)
+        if n_samples is None:
+            n_samples = pos_list.size
+        return pos_list[self.generator.integers(0, pos_list.size, size=(num_sets, n_samples))]
+
+    def gather(self, name, X, pos_list):
+        """
+        Get the rows of X at the positions.  Dense rows are copied into the
+        buffer called name, so the result is only valid until the next
+        gather into the same buffer.
+        """
+        if sparse.issparse(X):
+            return X[pos_list]
+        shape = (len(pos_list),) + X.shape[1:]
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != X.dtype:
+            buffer = np.empty(shape, dtype=X.dtype)
+            self.buffers[name] = buffer
+        return np.take(X, pos_list, axis=0, out=buffer)
+
+    def get_state(self):
+        return self.generator.bit_generator.state
+
+    def set_state(self, state):
+        self.generator.bit_generator.state = state
@@ -0,0 +1,38 @@
+import os
+import pickle
+
+
+def save_checkpoint(filename, state):
+    """
+    Write the state atomically: the pickle goes to a temporary file
+    that is renamed over the old checkpoint, so a crash while writing
+    leaves the previous checkpoint intact.
+
+    Args:
+        filename - Checkpoint file.
+        state - Dictionary with the loop state.
+    """
+    directory = os.path.dirname(filename)
+    if directory != "" and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    temp_filename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(temp_filename, "wb") as outfile:
+        outfile.write(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(temp_filename, filename)
+
+
+def load_checkpoint(filename):
+    """
+    Read a checkpoint written by save_checkpoint.
+
+    Args:
+        filename - Checkpoint file.
+    Return:
+        Dictionary with the loop state or None if there is no checkpoint.
+    """
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, "rb") as infile:
+        return pickle.loads(infile.read())
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class Evaluator:
+    """
+    Test set of a run kept in contiguous memory, used to score many linear
+    models at once.  The weights of the models are stacked into one matrix
+    so every prediction comes from a single matrix product.
+    """
+
+    def __init__(self, test_X, test_y):
+        self.test_X = test_X # Contiguous (or CSR) test features.
+        self.test_y = np.asarray(test_y, dtype=np.float64) # Test targets as a column.
+
+    def predict(self, models):
+        """
+        Predict the test set with every model.
+
+        Args:
+            models - Fitted SGDLinear models (a StackedSGDLinear adds one
+                column per learning rate).
+        Return:
+            Matrix with the predictions of one model per column.
+        """
+        coef = np.hstack([model.coef for model in models])
+        inter = np.hstack([model.inter for model in models])
+        return np.asarray(self.test_X @ coef + inter, dtype=np.float64)
+
+    def get_rmse(self, y_pred):
+        """
+        Rmse of every column of predictions, accumulated in double precision.
+        """
+        error = y_pred - self.test_y
+        return np.sqrt(np.sum(error * error, axis=0) / self.test_y.shape[0])
+
+    def evaluate(self, models):
+        return self.get_rmse(self.predict(models))
+
+    def evaluate_committee(self, model, committee):
+        """
+        Score a model and its committee.
+
+        Args:
+            model - Main model.
+            committee - Committee members.
+        Return:
+            Array with the rmse of the model, of the committee mean and of
+            each member.
+        """
+        y_pred = self.predict([model] + committee)
+        ensemble = y_pred[:, 1:].mean(axis=1, keepdims=True)
+        return np.concatenate([self.get_rmse(y_pred[:, :1]), self.get_rmse(ensemble), self.get_rmse(y_pred[:, 1:])])
@@ -0,0 +1,161 @@
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+import gzip
+import io
+import json
+import numpy as np
+import os
+import zipfile
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+WEEKDAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+
+
+def convert_date(value):
+    # Days since 1899-12-30, the serial date number of spreadsheets.
+    return float((datetime.date.fromisoformat(value) - datetime.date(1899, 12, 30)).days)
+
+
+def convert_month(value):
+    return float(MONTHS.index(value.lower()) + 1)
+
+
+def convert_weekday(value):
+    return float(WEEKDAYS.index(value.lower()))
+
+
+def round_half_up(value, decimals):
+    # Round like a spreadsheet displays a number, halves away from zero.
+    return float(Decimal(repr(value)).quantize(Decimal(1).scaleb(-decimals), rounding=ROUND_HALF_UP))
+
+
+CONVERTERS = {
+    "date": convert_date,
+    "month": convert_month,
+    "weekday": convert_weekday,
+}
+
+
+class Ingest:
+    """
+    Read a raw data set under data/original/ as described by the "source"
+    entry of its .meta file, for example:
+
+        "source": {
+          "file": "Bike-Sharing-Dataset.zip",
+          "member": "hour.csv",
+          "delimiter": ",",
+          "converters": {"1": "date"}
+        }
+
+    Other keys are "header" (false when the file has no header line),
+    "names" (column names, replacing the header line), "skip_rows" (lines
+    before the header or the data), "max_rows", "sheet" (index of the .xls
+    sheet) and "decimals" (round columns to the digits a spreadsheet
+    shows).  Zip members, .gz files,
+    delimited text and .xls sheets are streamed and converted to floats in
+    chunks of chunk_rows rows, without writing any intermediate file.
+    """
+
+    def __init__(self, name, chunk_rows = 4096):
+        self.name = name
+        self.chunk_rows = chunk_rows # Rows decoded and converted at a time.
+        with open("data/{}.meta".format(name), "r") as infile:
+            self.source = json.loads(infile.read())["source"]
+        self.filename = os.path.join("data", "original", self.source["file"])
+        self.converters = {int(pos): CONVERTERS[kind] for (pos, kind) in self.source.get("converters", {}).items()}
+        self.decimals = {int(pos): decimals for (pos, decimals) in self.source.get("decimals", {}).items()}
+        self.header = None # Column names, set once the rows are read.
+
+    def read(self):
+        """
+        Read the whole data set.
+
+        Return:
+            Tuple of the column names and the data matrix.
+        """
+        chunks = list(self.get_chunks())
+        return (self.header, np.concatenate(chunks, axis=0))
+
+    def get_chunks(self):
+        """
+        Yield the data as float matrices of at most chunk_rows rows.
+        """
+        if self.filename.endswith(".xls"):
+            rows = self.get_xls_rows()
+        else:
+            rows = self.get_text_rows()
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_rows:
+                yield self.convert(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            yield self.convert(chunk)
+
+    def convert(self, chunk):
+        for (pos, converter) in self.converters.items():
+            for row in chunk:
+                row[pos] = converter(row[pos])
+        for (pos, decimals) in self.decimals.items():
+            for row in chunk:
+                row[pos] = round_half_up(float(row[pos]), decimals)
+        return np.array(chunk, dtype=np.float64)
+
+    def get_text_rows(self):
+        """
+        Yield the split lines of a text source, decompressing on the fly.
+        """
+        if self.filename.endswith(".zip"):
+            with zipfile.ZipFile(self.filename) as archive:
+                with io.TextIOWrapper(archive.open(self.source["member"]), encoding="utf-8", newline="") as infile:
+                    yield from self.split_lines(infile)
+        elif self.filename.endswith(".gz"):
+            with gzip.open(self.filename, "rt", encoding="utf-8", newline="") as infile:
+                yield from self.split_lines(infile)
+        else:
+            with open(self.filename, "r", encoding="utf-8", newline="") as infile:
+                yield from self.split_lines(infile)
+
+    def split_lines(self, infile):
+        delimiter = self.source.get("delimiter") # None splits on whitespace.
+        lines = (line.rstrip("\r\n") for line in infile)
+        for i in range(self.source.get("skip_rows", 0)):
+            next(lines)
+        self.header = self.source.get("names")
+        if self.source.get("header", True):
+            names = [name.strip().strip('"') for name in next(lines).split(delimiter)]
+            if self.header is None:
+                self.header = names
+        max_rows = self.source.get("max_rows")
+        count = 0
+        for line in lines:
+            if max_rows is not None and count == max_rows:
+                break
+            if line.strip() == "":
+                continue
+            count += 1
+            yield line.split(delimiter)
+
+    def get_xls_rows(self):
+        if xlrd is None:
+            raise ImportError("Reading {} needs the xlrd package.".format(self.filename))
+        book = xlrd.open_workbook(self.filename, on_demand=True)
+        sheet = book.sheet_by_index(self.source.get("sheet", 0))
+        start = self.source.get("skip_rows", 0)
+        self.header = self.source.get("names")
+        if self.source.get("header", True):
+            if self.header is None:
+                self.header = [str(name).strip() for name in sheet.row_values(start)]
+            start += 1
+        stop = sheet.nrows
+        if self.source.get("max_rows") is not None:
+            stop = min(stop, start + self.source["max_rows"])
+        for i in range(start, stop):
+            yield sheet.row_values(i)
@@ -0,0 +1,57 @@
+import numpy as np
+from sklearn.neighbors import BallTree, KDTree
+
+
+class LabeledIndex:
+    """
+    Spatial index over the labeled points used to find the distance from
+    pool points to their closest labeled point.  Trees cannot be extended,
+    so each added batch gets its own tree and trees of similar size are
+    merged (like a binary counter).  There are never more than
+    log2(labeled count) trees to query.
+    """
+
+    def __init__(self, kind = "kdtree", leaf_size = 40):
+        self.kind = kind # "kdtree" or "balltree".
+        self.leaf_size = leaf_size
+        self.blocks = [] # List of (points, tree) from largest to smallest.
+        self.count = 0 # Number of points in the index.
+
+    def add(self, X):
+        """
+        Add a batch of points to the index.
+
+        Args:
+            X - Matrix with one point per row.
+        """
+        X = np.asarray(X)
+        if X.shape[0] == 0:
+            return
+        self.count += X.shape[0]
+        while len(self.blocks) > 0 and self.blocks[-1][0].shape[0] <= X.shape[0]:
+            (points, _) = self.blocks.pop()
+            X = np.vstack((points, X))
+        self.blocks.append((X, self.build(X)))
+
+    def build(self, X):
+        if self.kind == "kdtree":
+            return KDTree(X, leaf_size=self.leaf_size)
+        elif self.kind == "balltree":
+            return BallTree(X, leaf_size=self.leaf_size)
+        print("Index '{}' is unknown.".format(self.kind))
+        exit()
+
+    def query(self, X):
+        """
+        Distance from each row of X to the closest indexed point.
+
+        Args:
+            X - Matrix with one point per row.
+        Return:
+            Array of distances.
+        """
+        min_dist = np.full(X.shape[0], np.inf)
+        for (_, tree) in self.blocks:
+            (dist, _) = tree.query(X, k=1)
+            np.minimum(min_dist, dist[:, 0], out=min_dist)
+        return min_dist
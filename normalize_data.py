@@ -1,6 +1,8 @@
 import numpy as np
 import pickle
 import json
+from ingest import Ingest
+from scipy import sparse
 
 
 def main():
@@ -8,12 +10,18 @@ def main():
     for name in names:
         obj = Normalize(name)
         obj.process()
+    # Data sets with many one-hot columns also get a CSR version.
+    for name in ["forestfires", "bike"]:
+        obj = Normalize(name, is_sparse=True)
+        obj.process()
 
 
 class Normalize:
 
-    def __init__(self, name):
+    def __init__(self, name, is_sparse=False):
         self.name = name
+        self.is_sparse = is_sparse # Write a CSR feature matrix to data/<name>_sparse.dat.
+        self.hot_columns = [] # Sparse one-hot columns when is_sparse is set.
 
     def process(self):
         """
@@ -23,7 +31,6 @@ class Normalize:
         print()
         print("Normalizing {}...".format(self.name))
         self.__read_meta()
-        self.__read_header()
         self.__read_data()
 
         target = self.data[:, [self.meta["target_pos"]]]
@@ -32,6 +39,8 @@ class Normalize:
         self.__hot_encoder()
         self.__normalize()
         self.__filter_columns()
+        if self.is_sparse:
+            self.data = self.__get_sparse()
         self.data_obj = {
             'data': self.data,
             'target': target,
@@ -52,22 +61,46 @@ class Normalize:
                 return
 
     def __read_data(self):
+        if "source" in self.meta:
+            # Stream the raw file under data/original/ without a text copy.
+            try:
+                (header, self.data) = Ingest(self.name).read()
+                self.header = np.array(header)
+                return
+            except ImportError as error:
+                print("{} Reading data/{}.txt instead.".format(error, self.name))
+        self.__read_header()
         self.data = np.genfromtxt("data/{}.txt".format(self.name),
             delimiter="\t",
             skip_header = 1)
 
     def __write_data(self):
-        with open("data/{}.dat".format(self.name), "wb") as outfile:
+        filename = "data/{}_sparse.dat" if self.is_sparse else "data/{}.dat"
+        with open(filename.format(self.name), "wb") as outfile:
             outfile.write(pickle.dumps(self.data_obj))
 
     def __filter_columns(self):
-        m = list(range(self.data.shape[1]))
+        m = list(range(self.data.shape[1] + len(self.hot_columns)))
         del m[self.meta["target_pos"]]
         for pos in self.meta["omit_list"]:
             m.remove(pos)
-        self.data = self.data[:, m]
+        if self.is_sparse:
+            # One-hot columns are stored apart from the dense columns.
+            n = self.data.shape[1]
+            self.hot_columns = [self.hot_columns[pos - n] for pos in m if pos >= n]
+            m_dense = [pos for pos in m if pos < n]
+            self.data = self.data[:, m_dense]
+        else:
+            self.data = self.data[:, m]
         self.header = self.header[m]
 
+    def __get_sparse(self):
+        """
+        Combine the dense columns and the one-hot columns into a CSR matrix
+        with the same column order as the dense data set.
+        """
+        return sparse.hstack([sparse.csr_matrix(self.data)] + self.hot_columns, format="csr")
+
     def __hot_encoder(self):
         """
         """
@@ -77,7 +110,11 @@ class Normalize:
                 self.meta["omit_list"].append(pos)
                 for category in categories:
                     self.header = np.append(self.header, "{}_{}".format(self.header[pos], category))
-                    self.data = np.append(self.data, (self.data[:, pos] == category).astype(float)[..., None], 1)
+                    column = (self.data[:, pos] == category).astype(float)[..., None]
+                    if self.is_sparse:
+                        self.hot_columns.append(sparse.csr_matrix(column))
+                    else:
+                        self.data = np.append(self.data, column, 1)
 
     def __normalize(self):
         """
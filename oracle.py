@@ -0,0 +1,40 @@
+import asyncio
+import random
+
+
+class Oracle:
+    """
+    Interface of a labeling oracle.  Labels can take a long time to come
+    back, so label is a coroutine and many requests can be in flight.
+    """
+
+    async def label(self, pos):
+        """
+        Get the target of a point.
+
+        Args:
+            pos - Position of the point in the data set.
+        Return:
+            Target value.
+        """
+        raise NotImplementedError()
+
+
+class SimulatedOracle(Oracle):
+    """
+    Local stand in for an external oracle that answers from the known
+    targets after a simulated delay.
+    """
+
+    def __init__(self, target, latency = 0.1, jitter = 0.0, seed = None):
+        self.target = target # Targets to answer with.
+        self.latency = latency # Average seconds per label.
+        self.jitter = jitter # Delays are uniform in latency +/- jitter.
+        self.random = random.Random(seed)
+        self.count = 0 # Number of labels answered.
+
+    async def label(self, pos):
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        await asyncio.sleep(max(delay, 0))
+        self.count += 1
+        return self.target[pos, 0]
@@ -0,0 +1,42 @@
+import numpy as np
+import os
+from normalize_data import Normalize
+from ssbase import SemiSupervisedBase
+
+
+def main():
+    """
+    Compare the rmse curves of float32 runs against float64 runs
+    for every data set.  Data sets that have no data/<name>.dat yet (bike)
+    are normalized first, which writes data/<name>.dat to disk.
+    """
+    names = ["forestfires", "concrete", "cps", "pm10", "housing", "redwine", "whitewine", "bike"]
+    methods = ["random", "bemcm", "qbc", "greedy"]
+    for name in names:
+        if not os.path.isfile("data/{}.dat".format(name)):
+            Normalize(name).process()
+    if not os.path.isdir("results"):
+        os.mkdir("results")
+    with open("results/precision_report.txt", "w") as outfile:
+        outfile.write("name\tmethod\tmax_abs_diff\tmax_rel_diff\tfinal_rmse64\tfinal_rmse32\n")
+        for name in names:
+            for method in methods:
+                curves = {}
+                for dtype in [np.float64, np.float32]:
+                    s = SemiSupervisedBase(name, method)
+                    s.dtype = dtype
+                    if s.data["data"].shape[0] > 2000:
+                        # Without the pairwise distance cache brute force greedy takes hours.
+                        s.chunk_size = 2048
+                    (_, rmse_list) = s.get_runs()
+                    curves[dtype] = rmse_list.mean(axis=0)
+                diff = np.abs(curves[np.float64] - curves[np.float32])
+                rel_diff = diff / np.abs(curves[np.float64])
+                line = "{}\t{}\t{:.3g}\t{:.3g}\t{:.6f}\t{:.6f}".format(name, method,
+                    diff.max(), rel_diff.max(), curves[np.float64][-1], curves[np.float32][-1])
+                print(line)
+                outfile.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import hashlib
+import numpy as np
+import os
+import pickle
+import random
+from scipy import sparse
+
+
+def get_digest(data):
+    """
+    Hash of the content of a data set (features and targets), used to key
+    files derived from it.
+    """
+    digest = hashlib.sha1()
+    for key in ["data", "target"]:
+        if sparse.issparse(data[key]):
+            x = sparse.csr_matrix(data[key])
+            parts = [x.data, x.indices, x.indptr]
+        else:
+            x = np.ascontiguousarray(data[key])
+            parts = [x]
+        digest.update("{}{}".format(x.dtype.str, x.shape).encode())
+        for part in parts:
+            digest.update(np.ascontiguousarray(part).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def write_atomic(filename, value):
+    """
+    Write to a temporary file and rename it so concurrent processes never
+    read a partial file.
+    """
+    directory = os.path.dirname(filename)
+    if directory != "" and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    temp_filename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(temp_filename, "wb") as outfile:
+        if isinstance(value, np.ndarray):
+            np.save(outfile, value)
+        else:
+            outfile.write(value)
+    os.replace(temp_filename, filename)
+
+
+class PrecomputeCache:
+    """
+    Disk cache of the work that only depends on the data set and the
+    seed of a run, so it is shared by every method and every run.  The
+    cache directory is addressed by the content of the data set, so a
+    renormalized data set never reuses stale entries.
+    """
+    memory = {} # Last test set gathered in this process for each cache directory.
+
+    def __init__(self, name, data, directory = "cache", digest = None):
+        self.data = data
+        self.digest = digest or get_digest(data) # Content hash of the data set.
+        self.path = os.path.join(directory, "{}_{}".format(name, self.digest))
+        self.max_pairwise = 2000 # Largest data set that gets a pairwise distance matrix.
+
+    def get_split(self, seed, labeled_count, unlabeled_count):
+        """
+        Split the data into labeled, unlabeled and test positions the same
+        way as an uncached run.  The random module must already be seeded
+        with seed; its state after the shuffle is stored with the split and
+        restored on a cache hit so the rest of the run is unchanged.
+
+        Args:
+            seed - Seed of the run.
+            labeled_count - Size of the initial labeled set.
+            unlabeled_count - Size of the unlabeled pool.
+        Return:
+            Tuple of labeled, unlabeled and test position lists.
+        """
+        count = self.data["data"].shape[0]
+        filename = os.path.join(self.path, "split_{}_{}_{}.pkl".format(seed, labeled_count, unlabeled_count))
+        if os.path.isfile(filename):
+            with open(filename, "rb") as infile:
+                split = pickle.loads(infile.read())
+            random.setstate(split["state"])
+        else:
+            pos_list = list(range(count))
+            random.shuffle(pos_list)
+            split = {
+                "labeled": pos_list[:labeled_count],
+                "unlabeled": pos_list[labeled_count:(labeled_count+unlabeled_count)],
+                "test": pos_list[(labeled_count+unlabeled_count):],
+                "state": random.getstate(),
+            }
+            write_atomic(filename, pickle.dumps(split))
+        return (list(split["labeled"]), list(split["unlabeled"]), list(split["test"]))
+
+    def get_test(self, seed, test_pos_list):
+        """
+        Get the contiguous test features and targets of a run.
+        """
+        key = (seed, len(test_pos_list))
+        entry = PrecomputeCache.memory.get(self.path)
+        if entry is None or entry[0] != key:
+            test_X = self.data["data"][test_pos_list]
+            if sparse.issparse(test_X):
+                test_X = sparse.csr_matrix(test_X)
+            else:
+                test_X = np.ascontiguousarray(test_X)
+            # Only one test set is kept per data set so long lived workers do not grow.
+            entry = (key, (test_X, np.ascontiguousarray(self.data["target"][test_pos_list])))
+            PrecomputeCache.memory[self.path] = entry
+        return entry[1]
+
+    def get_pairwise(self):
+        """
+        Get the matrix of distances between every pair of points.  The
+        distances are computed exactly like SemiSupervisedBase.calc_distance
+        so greedy selects the same points: each row is one batched matmul,
+        which takes the same dot products as np.linalg.norm.  Only built
+        for dense data sets with at most max_pairwise points.
+
+        Return:
+            Memory-mapped distance matrix or None.
+        """
+        X = self.data["data"]
+        if X.shape[0] > self.max_pairwise or sparse.issparse(X):
+            return None
+        filename = os.path.join(self.path, "pairwise.npy")
+        if not os.path.isfile(filename):
+            # Rows in contiguous memory, like the differences norm gets in calc_distance.
+            X = np.ascontiguousarray(X)
+            dist = np.zeros((X.shape[0], X.shape[0]), dtype=X.dtype)
+            for i in range(X.shape[0] - 1):
+                diff = X[i] - X[i + 1:]
+                dist[i, i + 1:] = np.sqrt((diff[:, None, :] @ diff[:, :, None])[:, 0, 0])
+                dist[i + 1:, i] = dist[i, i + 1:]
+            write_atomic(filename, dist)
+        return np.load(filename, mmap_mode="r")
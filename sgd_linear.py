@@ -1,5 +1,6 @@
 import math
 import numpy as np
+from scipy import sparse
 
 
 class SGDLinear:
@@ -7,6 +8,9 @@ class SGDLinear:
     def __init__(self):
         self.learning_rate = 0.005
         self.num_epochs = 1
+        self.tol = None # Stop once no weight changes more than tol in a pass.
+        self.epochs_run = 0 # Passes made by the last fit.
+        self.dtype = np.float64 # Floating point precision of the weights.
         self.coef = None
         self.inter = None
 
@@ -18,12 +22,17 @@ class SGDLinear:
         xdim = x.shape[1]
         ydim = 1
         if self.coef is None:
-            self.coef = 0 * np.ones((xdim, 1))
-            self.inter = 0 * np.ones((ydim, 1))
+            self.coef = np.zeros((xdim, 1), dtype=self.dtype)
+            self.inter = np.zeros((ydim, 1), dtype=self.dtype)
+            return
+
+        if sparse.issparse(x):
+            self.fit_sparse(sparse.csr_matrix(x), transform_y)
             return
 
         i_train = list(range(num_training))
         for epoch in range(self.num_epochs):
+            (coef, inter) = (self.coef, self.inter)
             #np.random.shuffle(i_train)
             #subset_i_train = i_train[0:1]
             subset_i_train = i_train
@@ -31,9 +40,64 @@ class SGDLinear:
                 error = np.matmul(x[[i], :], self.coef) + self.inter - transform_y[[i], :]
                 self.coef = self.coef - self.learning_rate * np.matmul(np.transpose(x[[i], :]), error)
                 self.inter = self.inter - self.learning_rate * error
+            self.epochs_run = epoch + 1
+            if self.has_converged(coef, inter):
+                break
+
+    def has_converged(self, coef, inter):
+        """
+        Check if the weights moved less than tol since coef and inter.
+        """
+        if self.tol is None:
+            return False
+        change = max(np.max(np.abs(self.coef - coef)), np.max(np.abs(self.inter - inter)))
+        return change < self.tol
+
+    def fit_sparse(self, x, y):
+        """
+        Same updates as fit for a CSR matrix, only touching the weights
+        of the non-zero features of each row.
+        """
+        for epoch in range(self.num_epochs):
+            (old_coef, old_inter) = (self.coef.copy(), self.inter)
+            coef = self.coef[:, 0]
+            for i in range(x.shape[0]):
+                cols = x.indices[x.indptr[i]:x.indptr[i + 1]]
+                vals = x.data[x.indptr[i]:x.indptr[i + 1]]
+                error = np.dot(vals, coef[cols]) + self.inter[0, 0] - y[i, 0]
+                coef[cols] -= self.learning_rate * vals * error
+                self.inter = self.inter - self.learning_rate * error
+            self.epochs_run = epoch + 1
+            if self.has_converged(old_coef, old_inter):
+                break
 
     def predict(self, X):
-        y = np.matmul(X, self.coef) + self.inter
+        y = X @ self.coef + self.inter
         y = np.asmatrix(y)
         # y = np.exp(y) - 1
         return y
+
+
+class StackedSGDLinear(SGDLinear):
+    """
+    Several SGDLinear models that only differ in their learning rate,
+    trained in one pass over the data.  Column k of the weights follows
+    the same updates as an SGDLinear with learning_rates[k].
+    """
+
+    def __init__(self, learning_rates):
+        SGDLinear.__init__(self)
+        self.learning_rates = np.asarray(learning_rates, dtype=float)[None, :]
+
+    def fit(self, x, y):
+        num_models = self.learning_rates.shape[1]
+        if self.coef is None:
+            self.coef = np.zeros((x.shape[1], num_models), dtype=self.dtype)
+            self.inter = np.zeros((1, num_models), dtype=self.dtype)
+            return
+
+        for epoch in range(self.num_epochs):
+            for i in range(x.shape[0]):
+                error = np.matmul(x[[i], :], self.coef) + self.inter - y[[i], :]
+                self.coef = self.coef - self.learning_rates * np.matmul(np.transpose(x[[i], :]), error)
+                self.inter = self.inter - self.learning_rates * error
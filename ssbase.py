@@ -5,10 +5,17 @@ import numpy as np
 import os
 import pickle
 import random
+from bootstrap import Bootstrap
+from checkpoint import load_checkpoint, save_checkpoint
+from evaluation import Evaluator
+from labeled_index import LabeledIndex
+from precompute import PrecomputeCache, get_digest, write_atomic
+from scipy import sparse
 from sgd_linear import SGDLinear
 from sklearn.utils import resample
 from timer import Timer
 import time
+import heapq
 
 
 class SemiSupervisedBase:
@@ -22,29 +29,89 @@ class SemiSupervisedBase:
         self.label_percent = 0.1 # Percent of labeled data.
         self.test_percent = 0.2 # Percent of test data.
         self.batch_percent = 0.03 #0.03 # Percent of data to add to labeled data in each loop.
+        self.precompute_dir = "cache" # Directory of the per data set precomputation cache (None disables it).
+        self.plateau_patience = None # Stop a run after this many loops without the rmse improving (None never stops early).
+        self.plateau_tol = 0.001 # Relative rmse decrease that counts as an improvement.
+        self.time_budget = None # Stop a run after this many seconds (None has no limit).
+        self.label_budget = None # Stop a run before the labeled set would exceed this size (None has no limit).
+        self.learning_rate = 0.005 # SGD learning rate of the model and the committee.
+        self.num_epochs = 1 # Maximum SGD passes over the labeled data per fit.
+        self.sgd_tol = None # Stop the SGD passes once no weight changes more than this in a pass (None runs all passes).
+        self.checkpoint_every = None # Number of loops between checkpoints of the loop state (None disables checkpoints).
+        self.checkpoint_dir = "checkpoints" # Directory for checkpoints, a run resumes from its checkpoint if one exists.
+        self.dtype = np.float64 # Floating point precision for data, distances and models (np.float32 halves memory).
+        self.chunk_size = None # Rows scored at a time from a memory-mapped copy of the pool (None scores the pool in memory).
+        self.sparse_chunk_size = 1024 # Rows scored at a time for sparse data when chunk_size is None.
+        self.candidate_count = None # Number of unlabeled points scored per loop (None scores the whole pool).
+        self.candidate_mode = "random" # How candidates are drawn: "random" or "stratified".
+        self.candidate_strata = 10 # Number of strata used by stratified candidate sampling.
+        self.candidate_refresh = 1 # Number of loops between drawing a new candidate set.
+        self.diversity_weight = 1.0 # Weight of the redundancy penalty for bemcm_diverse.
+        self.greedy_index = "brute" # Nearest labeled search for greedy: "brute", "kdtree" or "balltree".
+        self.diversity_bandwidth = None # Kernel width for bemcm_diverse (None uses the median nearest neighbor distance in the pool).
+        self.track_committee = False # Also record the test rmse of the committee mean and of every member each loop.
+        self.bootstrap_mode = "sklearn" # How committee bootstraps are drawn: "sklearn" or "generator" (one vectorized NumPy Generator call per loop).
         # Initialize variables.
         self.cache = None # Used to cache values to speed up iterations.
         self.name = name # Name of the data set to use.
         self.method = method # Name of active learning method.
         self.qbc_models = []
+        self.feature_map = None # Memory-mapped feature matrix, replaces data["data"] when chunk_size is set.
+        self.strata = None # Stratum of every point used by stratified candidate sampling.
+        self.gain_evaluations = 0 # Marginal gains computed by the lazy greedy in bemcm_diverse.
+        self.seed = None # Seed of the current run (None when runs are not repeatable).
+        self.run_index = 0 # Index of the current run in get_runs.
+        self.data_digest = None # Content hash of the data in the configured precision.
+        self.stop_reason = None # Why the current run stopped: "iterations", "plateau", "time" or "labels".
+        self.stop_reasons = [] # Stop reason of each run of get_runs.
+        self.run_lengths = [] # Number of loops each run of get_runs finished.
+        self.precompute = None # Cache of splits and distances shared by all methods and runs.
+        self.test_X = None # Test features of the current run.
+        self.test_y = None # Test targets of the current run.
+        self.evaluator = None # Scores the model and the committee on the test set of the current run.
+        self.committee_rmse_list = [] # Rmse of the model, the committee mean and each member after every loop of the current run.
+        self.committee_rmse_lists = [] # committee_rmse_list of each run of get_runs.
+        self.bootstrap = None # Bootstrap sampler of the current run when bootstrap_mode is "generator".
         # Read data.
         with open("data/{}.dat".format(name), "rb") as infile:
             self.data = pickle.loads(infile.read())
 
-    def get_average(self):
-        print("Start process for {} {}...".format(self.name, self.method))
+    def get_runs(self):
+        """
+        Run the active learning loop num_runs times.
+
+        Args:
+            None
+        Return:
+            Tuple of the percent labeled per iteration and a matrix
+            with the rmse of each run (rows) at each iteration (columns).
+            Runs that stopped early keep their last values.
+        """
         rmse_list = []
         percent_list = []
+        self.stop_reasons = []
+        self.run_lengths = []
+        self.committee_rmse_lists = []
         for i in range(self.num_runs):
+            self.run_index = i
             if self.is_repeatable:
-                random.seed(i * 555)
-                np.random.seed(i * 555)
+                self.seed = i * 555
+                random.seed(self.seed)
+                np.random.seed(self.seed)
             (percent_labeled, rmse) = self.process()
             rmse_list.append(rmse)
-            percent_list = percent_labeled
+            percent_list.append(percent_labeled)
+            self.stop_reasons.append(self.stop_reason)
+            self.run_lengths.append(len(rmse))
+            self.committee_rmse_lists.append(np.array(self.committee_rmse_list))
+        M = max(len(rmse) for rmse in rmse_list)
+        rmse_list = [np.pad(rmse, (0, M - len(rmse)), mode="edge") for rmse in rmse_list]
+        percent_list = [percent for percent in percent_list if len(percent) == M][-1]
+        return (np.array(percent_list), np.array(rmse_list))
 
-        rmse_list = np.array(rmse_list)
-        percent_list = np.array(percent_list)
+    def get_average(self):
+        print("Start process for {} {}...".format(self.name, self.method))
+        (percent_list, rmse_list) = self.get_runs()
 
         # Calculate Average
         N = rmse_list.shape[0]
@@ -71,6 +138,17 @@ class SemiSupervisedBase:
             #        outfile.write(str(j) + "\t" + str(rmse_list[i, j]) + "\n")
             for i in range(len(y_average)):
                     outfile.write("{}\t{}\t{}\n".format(i, percent_list[i], y_average[i]))
+        with open("results/{}_{}_stop.tsv".format(self.name, self.method), "w") as outfile:
+            outfile.write("run\titerations\treason\n")
+            for i in range(N):
+                outfile.write("{}\t{}\t{}\n".format(i, self.run_lengths[i], self.stop_reasons[i]))
+        if self.track_committee:
+            with open("results/{}_{}_committee.tsv".format(self.name, self.method), "w") as outfile:
+                outfile.write("run\titeration\tmodel\tensemble\t{}\n".format(
+                    "\t".join("member{}".format(k) for k in range(self.num_committee))))
+                for i in range(N):
+                    for (j, row) in enumerate(self.committee_rmse_lists[i]):
+                        outfile.write("{}\t{}\t{}\n".format(i, j, "\t".join(str(x) for x in row)))
 
         # Build 1 stddev.
         y_top = y_average + y_stddev
@@ -135,47 +213,247 @@ class SemiSupervisedBase:
             None
         """
         Timer.start("Train")
+        start_time = time.time()
+        (count, start, percent_labeled, rmse_list) = self.start_run()
+        for j in range(start, self.num_iterations):
+            if self.stop_reason is not None:
+                break
+            Timer.start("{} iteration".format(j))
+            percent_labeled.append(1.0 * len(self.labeled_pos_list) / count)
+            rmse = self.train()
+            rmse_list.append(rmse)
+            self.stop_reason = self.get_stop_reason(rmse_list, start_time)
+            if self.stop_reason is None:
+                self.update_labeled()
+                if self.track_committee and len(self.qbc_models) > 0:
+                    # The committee that selected this batch.
+                    self.committee_rmse_list.append(self.evaluator.evaluate_committee(self.model, self.qbc_models))
+                if j + 1 == self.num_iterations:
+                    self.stop_reason = "iterations"
+            if self.checkpoint_every is not None and ((j + 1) % self.checkpoint_every == 0 or self.stop_reason is not None):
+                self.save_checkpoint(j + 1, percent_labeled, rmse_list)
+            total_time = Timer.stop("{} iteration".format(j))
+        total_time = Timer.stop("Train")
+        print("Full Training Cycle {:.2f}s".format(total_time))
+        return (np.array(percent_labeled), np.array(rmse_list))
+
+    def get_stop_reason(self, rmse_list, start_time):
+        """
+        Check the stopping policies after a loop has been evaluated.
+
+        Args:
+            rmse_list - Rmse of every loop of the run so far.
+            start_time - Time the run (or its resume) started.
+        Return:
+            Reason to stop or None to keep going.
+        """
+        if self.plateau_patience is not None:
+            best = None
+            since_best = 0
+            for rmse in rmse_list:
+                if best is None or rmse < best * (1 - self.plateau_tol):
+                    best = rmse
+                    since_best = 0
+                else:
+                    since_best += 1
+            if since_best >= self.plateau_patience:
+                return "plateau"
+        if self.time_budget is not None and time.time() - start_time >= self.time_budget:
+            return "time"
+        if self.label_budget is not None and len(self.labeled_pos_list) + self.batch_count > self.label_budget:
+            return "labels"
+        return None
+
+    def start_run(self):
+        """
+        Split the data and create the model for a new run, or restore
+        them from the checkpoint of this run.
+
+        Return:
+            Tuple of the data set size, the first loop to run and the
+            percent labeled and rmse lists of the finished loops.
+        """
         # Reset cache values
         self.cache = None
+        self.set_dtype()
+        if self.chunk_size is not None and not sparse.issparse(self.data["data"]):
+            # Read the features through the memory map so the dense copy is freed.
+            self.data["data"] = self.get_feature_map()
         # Get counts for different sets.
         count = self.data["data"].shape[0]
         labeled_count = int(math.ceil(count * self.label_percent))
         test_count = int(math.ceil(count * self.test_percent))
         unlabeled_count = count - labeled_count - test_count
         self.batch_count = int(math.ceil(count * self.batch_percent))
-        pos_list = list(range(count))
-        # Split the data into training/testing sets
-        random.shuffle(pos_list)
-        self.labeled_pos_list = pos_list[:labeled_count]
-        self.unlabeled_pos_list = pos_list[labeled_count:(labeled_count+unlabeled_count)]
-        self.test_pos_list = pos_list[(labeled_count+unlabeled_count):]
+        state = self.load_checkpoint()
+        if state is None:
+            if self.seed is not None and self.precompute_dir is not None:
+                # Reuse the split every method gets for this seed.
+                if self.precompute is None:
+                    self.precompute = PrecomputeCache(self.name, self.data, self.precompute_dir, self.get_data_digest())
+                (self.labeled_pos_list, self.unlabeled_pos_list, self.test_pos_list) = self.precompute.get_split(
+                    self.seed, labeled_count, unlabeled_count)
+            else:
+                pos_list = list(range(count))
+                # Split the data into training/testing sets
+                random.shuffle(pos_list)
+                self.labeled_pos_list = pos_list[:labeled_count]
+                self.unlabeled_pos_list = pos_list[labeled_count:(labeled_count+unlabeled_count)]
+                self.test_pos_list = pos_list[(labeled_count+unlabeled_count):]
+            self.candidates = None
+            self.candidate_age = 0
+            self.stop_reason = None
+            start = 0
+            rmse_list = []
+            # Use linear regression using SGD
+            self.model = self.new_model()
+            percent_labeled = []
+            self.committee_rmse_list = []
+            self.bootstrap = None
+            if self.bootstrap_mode == "generator":
+                self.bootstrap = Bootstrap(self.seed if self.seed is not None else random.randrange(2**32))
+        else:
+            start = state["iteration"]
+            self.stop_reason = state["stop_reason"]
+            rmse_list = state["rmse_list"]
+            percent_labeled = state["percent_labeled"]
+            self.committee_rmse_list = state["committee_rmse_list"]
+        self.labeled_index = None
+        if self.seed is not None and self.precompute is not None:
+            (self.test_X, self.test_y) = self.precompute.get_test(self.seed, self.test_pos_list)
+        else:
+            self.test_X = get_contiguous(self.data["data"][self.test_pos_list])
+            self.test_y = np.ascontiguousarray(self.data["target"][self.test_pos_list])
+        self.evaluator = Evaluator(self.test_X, self.test_y)
+        return (count, start, percent_labeled, rmse_list)
 
-        rmse_list = []
-        # Use linear regression using SGD
-        self.model = SGDLinear()
-        percent_labeled = []
-        for j in range(self.num_iterations):
-            Timer.start("{} iteration".format(j))
-            percent_labeled.append(1.0 * len(self.labeled_pos_list) / count)
-            rmse = self.train()
-            rmse_list.append(rmse)
-            self.update_labeled()
-            total_time = Timer.stop("{} iteration".format(j))
-        total_time = Timer.stop("Train")
-        print("Full Training Cycle {:.2f}s".format(total_time))
-        return (np.array(percent_labeled), np.array(rmse_list))
+    def get_config(self):
+        """
+        Configuration that a checkpoint has to match to be resumed.
+        """
+        config = {}
+        for key in ["num_committee", "num_iterations", "label_percent", "test_percent",
+                "batch_percent", "chunk_size", "sparse_chunk_size", "candidate_count", "candidate_mode",
+                "candidate_strata", "candidate_refresh", "greedy_index",
+                "diversity_weight", "diversity_bandwidth", "plateau_patience",
+                "plateau_tol", "time_budget", "label_budget", "learning_rate", "num_epochs", "sgd_tol",
+                "bootstrap_mode", "track_committee", "seed", "is_repeatable"]:
+            config[key] = getattr(self, key)
+        config["dtype"] = np.dtype(self.dtype).name
+        # Checkpoints of a renormalized data set are not reused.
+        config["data"] = self.get_data_digest()
+        return config
+
+    def get_checkpoint_filename(self):
+        return os.path.join(self.checkpoint_dir, "{}_{}_{}.ckpt".format(self.name, self.method, self.run_index))
+
+    def get_data_digest(self):
+        if self.data_digest is None:
+            self.data_digest = get_digest(self.data)
+        return self.data_digest
+
+    def save_checkpoint(self, iteration, percent_labeled, rmse_list):
+        """
+        Save everything the loop needs to continue after iteration.
+
+        Args:
+            iteration - Number of finished loops.
+            percent_labeled - Percent labeled of the finished loops.
+            rmse_list - Rmse of the finished loops.
+        """
+        state = {
+            "config": self.get_config(),
+            "iteration": iteration,
+            "percent_labeled": percent_labeled,
+            "rmse_list": rmse_list,
+            "labeled_pos_list": np.array(self.labeled_pos_list, dtype=np.int64),
+            "unlabeled_pos_list": np.array(self.unlabeled_pos_list, dtype=np.int64),
+            "test_pos_list": np.array(self.test_pos_list, dtype=np.int64),
+            "candidates": self.candidates,
+            "candidate_age": self.candidate_age,
+            "stop_reason": self.stop_reason,
+            "model": self.model,
+            "qbc_models": self.qbc_models,
+            "random_state": random.getstate(),
+            "np_random_state": np.random.get_state(),
+            "committee_rmse_list": self.committee_rmse_list,
+            "bootstrap_state": None if self.bootstrap is None else self.bootstrap.get_state(),
+        }
+        save_checkpoint(self.get_checkpoint_filename(), state)
+
+    def load_checkpoint(self):
+        """
+        Restore the loop state from the checkpoint of this run.
+
+        Return:
+            Checkpoint state or None if there is no usable checkpoint.
+        """
+        if self.checkpoint_every is None:
+            return None
+        state = load_checkpoint(self.get_checkpoint_filename())
+        if state is None or state["config"] != self.get_config():
+            return None
+        self.labeled_pos_list = state["labeled_pos_list"].tolist()
+        self.unlabeled_pos_list = state["unlabeled_pos_list"].tolist()
+        self.test_pos_list = state["test_pos_list"].tolist()
+        self.candidates = state["candidates"]
+        self.candidate_age = state["candidate_age"]
+        self.model = state["model"]
+        self.qbc_models = state["qbc_models"]
+        random.setstate(state["random_state"])
+        np.random.set_state(state["np_random_state"])
+        self.bootstrap = None
+        if state["bootstrap_state"] is not None:
+            self.bootstrap = Bootstrap()
+            self.bootstrap.set_state(state["bootstrap_state"])
+        if self.seed is not None and self.precompute_dir is not None and self.precompute is None:
+            self.precompute = PrecomputeCache(self.name, self.data, self.precompute_dir, self.get_data_digest())
+        return state
+
+    def set_dtype(self):
+        """
+        Cast the features and targets to the configured precision.
+        This is only done once as the cast data replaces the original.
+        """
+        if self.data["data"].dtype != self.dtype:
+            if sparse.issparse(self.data["data"]):
+                self.data["data"] = sparse.csr_matrix(self.data["data"], dtype=self.dtype)
+            else:
+                self.data["data"] = np.ascontiguousarray(self.data["data"], dtype=self.dtype)
+            self.data["target"] = np.ascontiguousarray(self.data["target"], dtype=self.dtype)
+            self.feature_map = None
+            self.precompute = None
+            self.data_digest = None
+
+    def new_model(self):
+        """
+        Create a learner that uses the configured precision.
+        """
+        model = SGDLinear()
+        model.dtype = self.dtype
+        model.learning_rate = self.learning_rate
+        model.num_epochs = self.num_epochs
+        model.tol = self.sgd_tol
+        return model
 
     def train(self):
         data_X_train = self.data["data"][ self.labeled_pos_list ]
-        data_X_test = self.data["data"][ self.test_pos_list ]
 
         # Split the targets into training/testing sets
         data_y_train = self.data["target"][ self.labeled_pos_list ]
-        data_y_test = self.data["target"][ self.test_pos_list ]
 
         # Train the model using the training sets
         self.model.fit(data_X_train, data_y_train)
 
+        return self.evaluate()
+
+    def evaluate(self):
+        """
+        Get the rmse of the model on the test set of the run.
+        """
+        data_X_test = self.test_X
+        data_y_test = self.test_y
+
         # Make predictions using the testing set
         data_y_pred = self.model.predict(data_X_test)
         #data_y_pred = self.model.predict(data_X_train)
@@ -197,6 +475,8 @@ class SemiSupervisedBase:
             self.update_labeled_qbc2()
         elif self.method == "bemcm":
             self.update_labeled_bemcm()
+        elif self.method == "bemcm_diverse":
+            self.update_labeled_bemcm_diverse()
         elif self.method == "none":
             pass
         else:
@@ -212,41 +492,47 @@ class SemiSupervisedBase:
 
     def update_labeled_greedy(self):
         Timer.reset("Greedy")
-        dist_list = []
-        for j in range(len(self.unlabeled_pos_list)):
-            pos = self.unlabeled_pos_list[j]
-            dist_list.append(self.get_min_distance(pos))
-        x = sorted(zip(dist_list, self.unlabeled_pos_list), reverse=True)
-        (_, pos_list) = zip(*x)
-        for pos in pos_list[:self.batch_count]:
-            self.labeled_pos_list.append(pos)
-            self.unlabeled_pos_list.remove(pos)
+        pool = self.get_pool()
+        if self.greedy_index != "brute" and not sparse.issparse(self.data["data"]):
+            if self.labeled_index is None:
+                self.labeled_index = LabeledIndex(self.greedy_index)
+            # Only index the points labeled since the last call.
+            self.labeled_index.add(self.data["data"][self.labeled_pos_list[self.labeled_index.count:]])
+            dist_list = self.labeled_index.query(self.data["data"][pool])
+            x = sorted(zip(dist_list, pool), reverse=True)
+            (_, pos_list) = zip(*x)
+        elif self.is_chunked():
+            labeled_X = self.get_rows(self.labeled_pos_list)
+            pos_list = self.select_chunked(pool, lambda X: self.score_greedy(X, labeled_X))
+        elif self.precompute is not None and self.precompute.get_pairwise() is not None:
+            dist_list = self.precompute.get_pairwise()[np.ix_(pool, self.labeled_pos_list)].min(axis=1)
+            x = sorted(zip(dist_list, pool), reverse=True)
+            (_, pos_list) = zip(*x)
+        else:
+            dist_list = []
+            for j in range(len(pool)):
+                pos = pool[j]
+                dist_list.append(self.get_min_distance(pos))
+            x = sorted(zip(dist_list, pool), reverse=True)
+            (_, pos_list) = zip(*x)
+        self.add_labeled(pos_list[:self.batch_count])
         Timer.stop("Greedy")
         #Timer.display("Greedy")
 
     def update_labeled_bemcm(self):
         Timer.reset("BEMCM")
-        # Build the committee.
-        if len(self.qbc_models) == 0:
-            for i in range(self.num_committee):
-                self.qbc_models.append(SGDLinear())
-
-        for i in range(self.num_committee):
-            # Build bootstrap of training data.
-            bootstrap_labeled_pos_list = resample(self.labeled_pos_list, random_state=random.randrange(1000000))
-
-            data_X_train = self.data["data"][ bootstrap_labeled_pos_list ]
+        self.train_committee()
 
-            # Split the targets into training/testing sets
-            data_y_train = self.data["target"][ bootstrap_labeled_pos_list ]
-
-            # Train the model using the training sets
-            self.qbc_models[i].fit(data_X_train, data_y_train)
+        pool = self.get_pool()
+        if self.is_chunked():
+            self.add_labeled(self.select_chunked(pool, self.score_bemcm, prefer_first=True))
+            Timer.stop("BEMCM")
+            return
 
         y_act = {}
         y_est = {}
         eq_24 = {}
-        for pos in self.unlabeled_pos_list:
+        for pos in pool:
             x = self.data["data"][ [pos] , : ]
             fx = self.model.predict(x)
             y_act[pos] = self.data["target"][pos]
@@ -260,7 +546,7 @@ class SemiSupervisedBase:
         for i in range(self.batch_count):
             max_change = -1
             max_pos = None
-            for pos in self.unlabeled_pos_list:
+            for pos in eq_24:
                 change = eq_24[pos]
                 if change > max_change:
                     max_pos = pos
@@ -271,25 +557,70 @@ class SemiSupervisedBase:
         Timer.stop("BEMCM")
         #Timer.display("BEMCM")
 
+    def update_labeled_bemcm_diverse(self):
+        """
+        Batch mode BEMCM that trades the expected model change of each
+        point against its similarity to points already in the batch.
+        The batch maximizes the submodular objective
+
+            f(S) = sum_i g_i - diversity_weight * sum_{i<j} k(x_i, x_j)
+
+        where g is the normalized equation 24 score and k a Gaussian
+        kernel.  Marginal gains only shrink as the batch grows, so a lazy
+        greedy priority queue only recomputes the gains that reach the top.
+        """
+        Timer.reset("BEMCM Diverse")
+        self.train_committee()
+        pool = self.get_pool()
+        X = self.data["data"][pool]
+        scores = np.asarray(self.score_bemcm(X), dtype=np.float64)
+        if scores.max() > 0:
+            scores = scores / scores.max()
+        bandwidth = self.diversity_bandwidth
+        if bandwidth is None:
+            sample = X[:200]
+            dist = np.sqrt(get_squared_distances(sample, sample))
+            np.fill_diagonal(dist, np.inf)
+            bandwidth = max(np.median(dist.min(axis=1)), 1e-12)
+
+        # Heap items are (-gain, pool index, batch size when the gain was computed).
+        heap = [(-scores[i], i, 0) for i in range(len(pool))]
+        heapq.heapify(heap)
+        penalty = np.zeros(len(pool))
+        batch = []
+        while len(batch) < self.batch_count and heap:
+            if heap[0][2] == len(batch):
+                batch.append(heapq.heappop(heap)[1])
+                continue
+            # Pop a block of stale gains and refresh them in one pass.
+            stale = []
+            while heap and heap[0][2] < len(batch) and len(stale) < 32:
+                stale.append(heapq.heappop(heap))
+            index = np.array([item[1] for item in stale])
+            size = np.array([item[2] for item in stale])
+            start = size.min()
+            kernel = np.exp(-get_squared_distances(X[index], X[batch[start:]]) / (2 * bandwidth * bandwidth))
+            # Only add the points picked since each gain was computed.
+            kernel[np.arange(len(batch) - start)[None, :] < (size - start)[:, None]] = 0
+            penalty[index] += kernel.sum(axis=1)
+            self.gain_evaluations += len(stale)
+            for i in index:
+                heapq.heappush(heap, (-(scores[i] - self.diversity_weight * penalty[i]), i, len(batch)))
+        self.add_labeled([pool[i] for i in batch])
+        Timer.stop("BEMCM Diverse")
+
     def update_labeled_qbc(self):
         Timer.start("QBC")
-        # Build the committee.
-        if len(self.qbc_models) == 0:
-            for i in range(self.num_committee):
-                self.qbc_models.append(SGDLinear())
+        self.train_committee(n_samples=int(len(self.labeled_pos_list) * 0.5))
 
-        for i in range(self.num_committee):
-            # Build bootstrap of training data.
-            bootstrap_labeled_pos_list = resample(self.labeled_pos_list, n_samples=int(len(self.labeled_pos_list) * 0.5), random_state=random.randrange(1000000))
-            # Get bootstrap training set.
-            data_X_train = self.data["data"][ bootstrap_labeled_pos_list ]
-            # Get bootstrap target set.
-            data_y_train = self.data["target"][ bootstrap_labeled_pos_list ]
-            # Train the model using the training sets
-            self.qbc_models[i].fit(data_X_train, data_y_train)
+        pool = self.get_pool()
+        if self.is_chunked():
+            self.add_labeled(self.select_chunked(pool, self.score_qbc))
+            Timer.stop("QBC")
+            return
 
         variances = []
-        for pos in self.unlabeled_pos_list:
+        for pos in pool:
             variance = 0
             y_ave = 0
             for model in self.qbc_models:
@@ -317,15 +648,13 @@ class SemiSupervisedBase:
         # Build the committee.
         for i in range(self.batch_count):
             models = []
-            for i in range(self.num_committee):
-                # Build bootstrap of training data.
-                bootstrap_labeled_pos_list = resample(self.labeled_pos_list, random_state=random.randrange(1000000))
+            for bootstrap_labeled_pos_list in self.get_bootstraps():
                 # Get bootstrap training set.
-                data_X_train = self.data["data"][ bootstrap_labeled_pos_list ]
+                data_X_train = self.get_bootstrap_rows("data", bootstrap_labeled_pos_list)
                 # Get bootstrap target set.
-                data_y_train = self.data["target"][ bootstrap_labeled_pos_list ]
+                data_y_train = self.get_bootstrap_rows("target", bootstrap_labeled_pos_list)
                 # Create linear regression object
-                model = SGDLinear()
+                model = self.new_model()
                 # Train the model using the training sets
                 model.fit(data_X_train, data_y_train)
                 models.append(model)
@@ -350,6 +679,232 @@ class SemiSupervisedBase:
         total_time = Timer.stop("QBC2")
         #print("Greedy Update {:.2f}s".format(total_time))
 
+    def train_committee(self, n_samples=None):
+        """
+        Fit each committee member on a bootstrap of the labeled set.
+
+        Args:
+            n_samples - Size of each bootstrap (None uses the labeled count).
+        """
+        if len(self.qbc_models) == 0:
+            for i in range(self.num_committee):
+                self.qbc_models.append(self.new_model())
+
+        for (i, bootstrap_labeled_pos_list) in enumerate(self.get_bootstraps(n_samples)):
+            # Get bootstrap training set.
+            data_X_train = self.get_bootstrap_rows("data", bootstrap_labeled_pos_list)
+            # Get bootstrap target set.
+            data_y_train = self.get_bootstrap_rows("target", bootstrap_labeled_pos_list)
+            # Train the model using the training sets
+            self.qbc_models[i].fit(data_X_train, data_y_train)
+
+    def get_bootstraps(self, n_samples=None):
+        """
+        Draw one bootstrap of the labeled set per committee member.
+
+        Args:
+            n_samples - Size of each bootstrap (None uses the labeled count).
+        Return:
+            Sequence of num_committee position lists.
+        """
+        if self.bootstrap is not None:
+            return self.bootstrap.get_indices(self.labeled_pos_list, self.num_committee, n_samples)
+        return [resample(self.labeled_pos_list, n_samples=n_samples, random_state=random.randrange(1000000))
+            for i in range(self.num_committee)]
+
+    def get_bootstrap_rows(self, key, pos_list):
+        """
+        Gather the rows of self.data[key] for a bootstrap, into a reused
+        buffer when bootstrap_mode is "generator".
+        """
+        if self.bootstrap is not None:
+            return self.bootstrap.gather(key, self.data[key], pos_list)
+        return self.data[key][pos_list]
+
+    def add_labeled(self, pos_list):
+        """
+        Move the given positions from the unlabeled pool to the labeled set.
+
+        Args:
+            pos_list - Positions in the order they were selected.
+        """
+        selected = set(pos_list)
+        self.labeled_pos_list.extend(pos_list)
+        self.unlabeled_pos_list = [pos for pos in self.unlabeled_pos_list if pos not in selected]
+
+    def is_chunked(self):
+        """
+        Sparse data is always scored with the vectorized chunked path.
+        """
+        return self.chunk_size is not None or sparse.issparse(self.data["data"])
+
+    def get_feature_map(self):
+        """
+        Get a read only memory map of the feature matrix.  The matrix is
+        written next to the data set the first time it is needed, named by
+        the content of the data so a renormalized data set gets a new file.
+        With chunk_size set, start_run swaps the map in for data["data"];
+        the pickled data set is still loaded whole once to write the file.
+
+        Return:
+            Memory-mapped feature matrix in the configured precision.
+        """
+        if self.feature_map is None:
+            filename = "data/{}_{}_{}.npy".format(self.name, np.dtype(self.dtype).name, self.get_data_digest())
+            if not os.path.isfile(filename):
+                write_atomic(filename, np.ascontiguousarray(self.data["data"], dtype=self.dtype))
+            self.feature_map = np.load(filename, mmap_mode="r")
+        return self.feature_map
+
+    def get_rows(self, pos_list):
+        """
+        Gather rows from the feature map in file order and return them
+        in the order of pos_list.
+        """
+        pos_list = np.asarray(pos_list, dtype=np.int64)
+        if sparse.issparse(self.data["data"]):
+            return self.data["data"][pos_list]
+        order = np.argsort(pos_list, kind="stable")
+        rows = np.empty((pos_list.size, self.data["data"].shape[1]), dtype=self.dtype)
+        rows[order] = self.get_feature_map()[pos_list[order]]
+        return rows
+
+    def get_pool(self):
+        """
+        Get the unlabeled points to score in this loop.  When
+        candidate_count is set this is a random or stratified subset of
+        the pool that is redrawn every candidate_refresh loops; in between,
+        the same candidates are reused minus the ones that were labeled,
+        unless fewer than batch_count of them are left.
+
+        Return:
+            List of unlabeled positions.
+        """
+        if self.candidate_count is None:
+            return self.unlabeled_pos_list
+        count = max(self.candidate_count, self.batch_count)
+        if len(self.unlabeled_pos_list) <= count:
+            return self.unlabeled_pos_list
+        if self.candidates is not None:
+            labeled = set(self.labeled_pos_list)
+            self.candidates = [pos for pos in self.candidates if pos not in labeled]
+        # Redraw when too few candidates are left to fill a batch.
+        if self.candidates is None or self.candidate_age >= self.candidate_refresh or len(self.candidates) < self.batch_count:
+            if self.candidate_mode == "random":
+                self.candidates = random.sample(self.unlabeled_pos_list, count)
+            elif self.candidate_mode == "stratified":
+                self.candidates = self.get_stratified_sample(count)
+            else:
+                print("Candidate mode '{}' is unknown.".format(self.candidate_mode))
+                exit()
+            self.candidate_age = 0
+        self.candidate_age += 1
+        return self.candidates
+
+    def get_stratified_sample(self, count):
+        """
+        Sample unlabeled points proportionally from each stratum.  Strata
+        are quantile bins of the projection onto the first principal
+        component of the features, so the sample covers the feature space.
+
+        Args:
+            count - Number of points to sample.
+        Return:
+            List of unlabeled positions.
+        """
+        if self.strata is None:
+            X = self.data["data"]
+            mean = np.asarray(X.mean(axis=0)).ravel()
+            sample = X[::max(1, X.shape[0] // 10000)]
+            if sparse.issparse(sample):
+                sample = sample.toarray()
+            (_, _, vt) = np.linalg.svd(sample - mean, full_matrices=False)
+            projection = X @ vt[0] - np.dot(mean, vt[0])
+            edges = np.quantile(projection, np.linspace(0, 1, self.candidate_strata + 1)[1:-1])
+            self.strata = np.searchsorted(edges, projection)
+        unlabeled = np.array(self.unlabeled_pos_list)
+        groups = self.strata[unlabeled]
+        sizes = np.bincount(groups, minlength=self.candidate_strata)
+        # Largest remainder allocation so the counts add up to count.
+        quota = 1.0 * count * sizes / len(unlabeled)
+        stratum_counts = np.floor(quota).astype(int)
+        extra = np.argsort(stratum_counts - quota)[:(count - stratum_counts.sum())]
+        stratum_counts[extra] += 1
+        sample = []
+        for stratum in range(self.candidate_strata):
+            members = unlabeled[groups == stratum].tolist()
+            sample.extend(random.sample(members, int(stratum_counts[stratum])))
+        return sample
+
+    def select_chunked(self, pool, score_fn, prefer_first=False):
+        """
+        Exact top batch_count selection that scores the unlabeled pool
+        chunk_size rows at a time.  Only the best candidates seen so far
+        are kept in a bounded heap.
+
+        Args:
+            pool - Unlabeled positions to score.
+            score_fn - Function mapping a block of rows to their scores.
+            prefer_first - Break ties by pool order instead of by the
+                larger position (matches update_labeled_bemcm).
+        Return:
+            Selected positions sorted from best to worst.
+        """
+        heap = []
+        k = self.batch_count
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            # Sparse scores build dense chunk by labeled blocks, so keep chunks bounded.
+            chunk_size = self.sparse_chunk_size if sparse.issparse(self.data["data"]) else max(len(pool), 1)
+        for start in range(0, len(pool), chunk_size):
+            pos_chunk = np.array(pool[start:(start + chunk_size)], dtype=np.int64)
+            scores = np.asarray(score_fn(self.get_rows(pos_chunk)), dtype=np.float64).ravel()
+            if prefer_first:
+                ties = -np.arange(start, start + pos_chunk.size)
+            else:
+                ties = pos_chunk
+            # Keep only the chunk's best k before touching the heap.
+            best = np.lexsort((ties, scores))[-k:]
+            for i in best:
+                item = (scores[i], int(ties[i]), int(pos_chunk[i]))
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        return [item[2] for item in sorted(heap, reverse=True)]
+
+    def score_greedy(self, X, labeled_X):
+        """
+        Distance from each row of X to its closest labeled row.
+        """
+        if sparse.issparse(X):
+            min_dist = np.full(X.shape[0], np.inf)
+            for start in range(0, labeled_X.shape[0], self.sparse_chunk_size):
+                block = labeled_X[start:(start + self.sparse_chunk_size)]
+                np.minimum(min_dist, get_squared_distances(X, block).min(axis=1), out=min_dist)
+            return np.sqrt(min_dist)
+        min_dist = np.full(X.shape[0], np.inf, dtype=self.dtype)
+        for row in labeled_X:
+            diff = X - row
+            np.minimum(min_dist, np.einsum("ij,ij->i", diff, diff), out=min_dist)
+        return np.sqrt(min_dist)
+
+    def score_qbc(self, X):
+        """
+        Variance of the committee predictions for each row of X.
+        """
+        y = np.hstack([np.asarray(model.predict(X)) for model in self.qbc_models])
+        y_ave = y.mean(axis=1)
+        return (y * y).mean(axis=1) - y_ave * y_ave
+
+    def score_bemcm(self, X):
+        """
+        Expected model change (equation 24 of Cai 2017) for each row of X.
+        """
+        fx = np.asarray(self.model.predict(X))
+        y = np.hstack([np.asarray(model.predict(X)) for model in self.qbc_models])
+        return np.abs(fx - y).mean(axis=1) * np.sqrt(get_squared_norms(X))
+
     def get_min_distance(self, i):
         min_dist = None
         min_pos = -1
@@ -375,6 +930,36 @@ class SemiSupervisedBase:
         return x
 
 
+def get_contiguous(X):
+    """
+    Copy of X in contiguous memory (CSR for sparse matrices).
+    """
+    if sparse.issparse(X):
+        return sparse.csr_matrix(X)
+    return np.ascontiguousarray(X)
+
+
+def get_squared_norms(X):
+    """
+    Squared norm of each row of a dense or sparse matrix.
+    """
+    if sparse.issparse(X):
+        return np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    return np.einsum("ij,ij->i", X, X)
+
+
+def get_squared_distances(A, B):
+    """
+    Squared distances between the rows of A and the rows of B for dense
+    or sparse matrices.
+    """
+    product = A @ B.T
+    if sparse.issparse(product):
+        product = product.toarray()
+    dist = get_squared_norms(A)[:, None] + get_squared_norms(B)[None, :] - 2 * np.asarray(product)
+    return np.maximum(dist, 0)
+
+
 def get_mean_absolute_error(y_actual, y_predict):
     T = y_actual.shape[0]
     mae = np.sum(abs(y_actual - y_predict)) / T
@@ -382,6 +967,8 @@ def get_mean_absolute_error(y_actual, y_predict):
 
 
 def get_root_mean_squared(y_actual, y_predict):
+    # Accumulate in double precision so float32 runs are comparable.
+    error = np.asarray(y_actual, dtype=np.float64) - np.asarray(y_predict, dtype=np.float64)
     T = y_actual.shape[0]
-    rmse = math.sqrt(np.transpose(y_actual - y_predict) * (y_actual - y_predict) / T)
+    rmse = math.sqrt(np.sum(error * error) / T)
     return rmse
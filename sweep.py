@@ -0,0 +1,156 @@
+import itertools
+from multiprocessing import Pool
+import numpy as np
+import os
+import random
+from sgd_linear import StackedSGDLinear
+from ssbase import SemiSupervisedBase, get_root_mean_squared
+
+
+# Methods that select points without looking at the model.
+MODEL_FREE_METHODS = ["random", "greedy"]
+
+
+class Sweep:
+    """
+    Evaluate a grid of configurations on one data set.  Every job uses the
+    splits of the precomputation cache, so all configurations see the same
+    data.  Random and greedy do not look at the model when they select
+    points, so their learning rates share one pool and train as one
+    StackedSGDLinear.  Jobs run in parallel on all cores.
+    """
+
+    def __init__(self, name, methods, grid):
+        self.name = name # Name of the data set.
+        self.methods = methods # Active learning methods to sweep.
+        self.grid = grid # Lists of values for learning_rate, num_committee, batch_percent and label_percent.
+        self.num_runs = 3 # Runs per configuration.
+        self.num_iterations = 11 # Active learning loops per run.
+
+    def get_jobs(self):
+        """
+        Split the grid into jobs.  A job is a method, a configuration
+        (with a list of learning rates for model free methods) and a run.
+        """
+        jobs = []
+        for method in self.methods:
+            # Only committee methods depend on the committee size.
+            committees = self.grid["num_committee"] if method in ["qbc", "qbc2", "bemcm", "bemcm_diverse"] else [None]
+            for (num_committee, batch_percent, label_percent) in itertools.product(committees,
+                    self.grid["batch_percent"], self.grid["label_percent"]):
+                if method in MODEL_FREE_METHODS:
+                    learning_rates = [self.grid["learning_rate"]]
+                else:
+                    learning_rates = [[rate] for rate in self.grid["learning_rate"]]
+                for rates in learning_rates:
+                    for run in range(self.num_runs):
+                        jobs.append({
+                            "name": self.name,
+                            "method": method,
+                            "learning_rates": rates,
+                            "num_committee": num_committee,
+                            "batch_percent": batch_percent,
+                            "label_percent": label_percent,
+                            "num_iterations": self.num_iterations,
+                            "run": run,
+                        })
+        return jobs
+
+    def run(self, processes = None):
+        """
+        Run every job.
+
+        Args:
+            processes - Number of worker processes (None uses every core).
+        Return:
+            List of result rows.
+        """
+        jobs = self.get_jobs()
+        rows = []
+        with Pool(processes) as pool:
+            for job_rows in pool.imap(run_job, jobs):
+                rows.extend(job_rows)
+        return rows
+
+    def write(self, rows, filename):
+        directory = os.path.dirname(filename)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory)
+        keys = ["name", "method", "learning_rate", "num_committee", "batch_percent",
+            "label_percent", "run", "iteration", "percent_labeled", "rmse"]
+        with open(filename, "w") as outfile:
+            outfile.write("\t".join(keys) + "\n")
+            for row in rows:
+                outfile.write("\t".join(str(row[key]) for key in keys) + "\n")
+
+
+def run_job(job):
+    """
+    Run one sweep job and return one row per learning rate and loop.
+    """
+    s = SemiSupervisedBase(job["name"], job["method"])
+    s.num_iterations = job["num_iterations"]
+    s.batch_percent = job["batch_percent"]
+    s.label_percent = job["label_percent"]
+    if job["num_committee"] is not None:
+        s.num_committee = job["num_committee"]
+    s.seed = job["run"] * 555
+    random.seed(s.seed)
+    np.random.seed(s.seed)
+    if len(job["learning_rates"]) == 1:
+        s.learning_rate = job["learning_rates"][0]
+        (percent_labeled, rmse_list) = s.process()
+        rmse_list = np.array(rmse_list)[:, None]
+    else:
+        (percent_labeled, rmse_list) = run_stacked(s, job["learning_rates"])
+    rows = []
+    for (k, learning_rate) in enumerate(job["learning_rates"]):
+        for j in range(len(percent_labeled)):
+            rows.append({
+                "name": job["name"],
+                "method": job["method"],
+                "learning_rate": learning_rate,
+                "num_committee": "-" if job["num_committee"] is None else job["num_committee"],
+                "batch_percent": job["batch_percent"],
+                "label_percent": job["label_percent"],
+                "run": job["run"],
+                "iteration": j,
+                "percent_labeled": percent_labeled[j],
+                "rmse": rmse_list[j, k],
+            })
+    return rows
+
+
+def run_stacked(s, learning_rates):
+    """
+    Same loop as SemiSupervisedBase.process for a model free method,
+    with one model per learning rate trained together.
+    """
+    (count, start, percent_labeled, rmse_list) = s.start_run()
+    s.model = StackedSGDLinear(learning_rates)
+    s.model.dtype = s.dtype
+    for j in range(s.num_iterations):
+        percent_labeled.append(1.0 * len(s.labeled_pos_list) / count)
+        s.model.fit(s.data["data"][s.labeled_pos_list], s.data["target"][s.labeled_pos_list])
+        y_pred = np.asarray(s.model.predict(s.test_X))
+        rmse_list.append([get_root_mean_squared(s.test_y, y_pred[:, [k]]) for k in range(len(learning_rates))])
+        s.update_labeled()
+    return (np.array(percent_labeled), np.array(rmse_list))
+
+
+def main():
+    grid = {
+        "learning_rate": [0.001, 0.005, 0.01, 0.05],
+        "num_committee": [4, 8],
+        "batch_percent": [0.03],
+        "label_percent": [0.1],
+    }
+    rows = []
+    for name in ["concrete", "housing"]:
+        sweep = Sweep(name, ["random", "qbc", "greedy"], grid)
+        rows.extend(sweep.run())
+    sweep.write(rows, "results/sweep.txt")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,25 @@
+import asyncio
+import http.client
+import json
+import threading
 import unittest
-from sgd_linear import SGDLinear
+from al_service import QueryService, create_server
+from async_al import AsyncActiveLearner
+from batch import pack, run_batch
+from bootstrap import Bootstrap
+from ingest import Ingest
+from labeled_index import LabeledIndex
+from oracle import SimulatedOracle
+from precompute import PrecomputeCache
+from scipy import sparse
+from sgd_linear import SGDLinear, StackedSGDLinear
+from ssbase import SemiSupervisedBase, get_root_mean_squared
+from sweep import Sweep, run_job
 import numpy as np
+import os
+import random
+import shutil
+import tempfile
 
 
 class TestAL(unittest.TestCase):
@@ -39,6 +58,429 @@ class TestAL(unittest.TestCase):
         x = predictor.predict(np.array([[3, 2]]))
         self.assertEqual(x[0], 6.811)
 
+    def test_float32(self):
+        curves = {}
+        for dtype in [np.float64, np.float32]:
+            s = SemiSupervisedBase("housing", "qbc")
+            s.num_runs = 1
+            s.num_iterations = 2
+            s.dtype = dtype
+            (_, rmse_list) = s.get_runs()
+            self.assertEqual(s.data["data"].dtype, dtype)
+            self.assertEqual(s.model.coef.dtype, dtype)
+            curves[dtype] = rmse_list[0]
+        self.assertTrue(np.allclose(curves[np.float32], curves[np.float64], rtol=1e-4))
+
+    def test_chunked_selection(self):
+        for method in ["qbc", "bemcm"]:
+            labeled = []
+            for chunk_size in [None, 37]:
+                s = SemiSupervisedBase("housing", method)
+                s.num_iterations = 4
+                s.chunk_size = chunk_size
+                random.seed(555)
+                np.random.seed(555)
+                s.process()
+                labeled.append(s.labeled_pos_list)
+            self.assertEqual(labeled[0], labeled[1])
+            # The chunked run reads its features through the memory map.
+            self.assertIsInstance(s.data["data"], np.memmap)
+
+        # A renormalized data set gets its own feature map.
+        s = SemiSupervisedBase("housing", "qbc")
+        s.data["data"] = s.data["data"] * 0.5
+        feature_map = s.get_feature_map()
+        try:
+            self.assertTrue(np.array_equal(feature_map, s.data["data"]))
+        finally:
+            os.remove(feature_map.filename)
+
+    def test_candidates(self):
+        for mode in ["random", "stratified"]:
+            s = SemiSupervisedBase("housing", "qbc")
+            s.num_iterations = 4
+            s.candidate_count = 50
+            s.candidate_mode = mode
+            s.candidate_refresh = 2
+            random.seed(555)
+            np.random.seed(555)
+            s.process()
+            self.assertEqual(len(s.labeled_pos_list), len(set(s.labeled_pos_list)))
+            self.assertEqual(len(s.labeled_pos_list), 51 + 4 * s.batch_count)
+            self.assertFalse(set(s.labeled_pos_list) & set(s.unlabeled_pos_list))
+
+        # Candidates run out before the refresh and have to be redrawn.
+        for method in ["qbc", "bemcm", "greedy"]:
+            s = SemiSupervisedBase("housing", method)
+            s.num_iterations = 8
+            s.candidate_count = 20
+            s.candidate_refresh = 5
+            random.seed(555)
+            np.random.seed(555)
+            s.process()
+            self.assertEqual(len(s.labeled_pos_list), len(set(s.labeled_pos_list)))
+            self.assertEqual(len(s.labeled_pos_list), 51 + 8 * s.batch_count)
+
+    def test_bemcm_diverse(self):
+        labeled = []
+        for method in ["bemcm", "bemcm_diverse"]:
+            s = SemiSupervisedBase("housing", method)
+            s.num_iterations = 4
+            s.diversity_weight = 0
+            random.seed(555)
+            np.random.seed(555)
+            s.process()
+            labeled.append(s.labeled_pos_list)
+        # Without the redundancy penalty the lazy greedy matches bemcm.
+        self.assertEqual(labeled[0], labeled[1])
+
+    def test_labeled_index(self):
+        rng = np.random.RandomState(555)
+        X = rng.rand(500, 4)
+        for kind in ["kdtree", "balltree"]:
+            index = LabeledIndex(kind)
+            for start in range(0, 100, 7):
+                index.add(X[start:min(start + 7, 100)])
+            self.assertEqual(index.count, 100)
+            self.assertTrue(len(index.blocks) <= 7)
+            brute = np.sqrt(((X[100:, None, :] - X[None, :100, :]) ** 2).sum(axis=2)).min(axis=1)
+            self.assertTrue(np.allclose(index.query(X[100:]), brute))
+
+    def test_precompute(self):
+        directory = tempfile.mkdtemp()
+        try:
+            results = []
+            for (method, precompute_dir) in [("greedy", None), ("greedy", directory), ("greedy", directory), ("qbc", directory)]:
+                s = SemiSupervisedBase("housing", method)
+                s.num_runs = 2
+                s.num_iterations = 3
+                s.precompute_dir = precompute_dir
+                (_, rmse_list) = s.get_runs()
+                results.append((rmse_list, s.labeled_pos_list[:51], s.test_pos_list))
+            for (rmse_list, labeled, test) in results[1:3]:
+                self.assertTrue(np.array_equal(rmse_list, results[0][0]))
+            # Every method shares the same split.
+            self.assertEqual(results[3][1:], results[0][1:])
+            # The pairwise matrix matches calc_distance bit for bit.
+            dist = s.precompute.get_pairwise()
+            for i in range(0, dist.shape[0], 25):
+                for j in range(0, dist.shape[0], 15):
+                    self.assertEqual(dist[i, j], s.calc_distance(i, j))
+            # Both runs used the cache but only the last test set is kept.
+            self.assertEqual(len([path for path in PrecomputeCache.memory if path.startswith(directory)]), 1)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_checkpoint_resume(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for method in ["qbc", "greedy"]:
+                s = SemiSupervisedBase("housing", method)
+                s.num_runs = 2
+                s.num_iterations = 5
+                s.precompute_dir = None
+                (_, expected) = s.get_runs()
+
+                s = SemiSupervisedBase("housing", method)
+                s.num_runs = 2
+                s.num_iterations = 5
+                s.precompute_dir = None
+                s.checkpoint_every = 1
+                s.checkpoint_dir = directory
+                update_labeled = s.update_labeled
+                calls = []
+                def crash():
+                    calls.append(1)
+                    if len(calls) == 8:
+                        raise KeyboardInterrupt()
+                    update_labeled()
+                s.update_labeled = crash
+                with self.assertRaises(KeyboardInterrupt):
+                    s.get_runs()
+
+                s = SemiSupervisedBase("housing", method)
+                s.num_runs = 2
+                s.num_iterations = 5
+                s.precompute_dir = None
+                s.checkpoint_every = 1
+                s.checkpoint_dir = directory
+                (_, rmse_list) = s.get_runs()
+                self.assertTrue(np.array_equal(rmse_list, expected))
+
+            # A renormalized data set does not resume old checkpoints.
+            s = SemiSupervisedBase("housing", "greedy")
+            s.num_iterations = 5
+            s.precompute_dir = None
+            s.checkpoint_every = 1
+            s.checkpoint_dir = directory
+            s.seed = 0
+            self.assertIsNotNone(s.load_checkpoint())
+            s.data["data"] = s.data["data"] * 0.5
+            s.data_digest = None
+            self.assertIsNone(s.load_checkpoint())
+
+            # An unseeded run does not resume a seeded checkpoint.
+            s = SemiSupervisedBase("housing", "greedy")
+            s.num_iterations = 5
+            s.precompute_dir = None
+            s.checkpoint_every = 1
+            s.checkpoint_dir = directory
+            s.seed = 0
+            self.assertIsNotNone(s.load_checkpoint())
+            s.seed = None
+            s.is_repeatable = False
+            self.assertIsNone(s.load_checkpoint())
+
+            # Runs without a seed get their own checkpoints.
+            s = SemiSupervisedBase("housing", "random")
+            s.num_runs = 3
+            s.num_iterations = 3
+            s.is_repeatable = False
+            s.checkpoint_every = 1
+            s.checkpoint_dir = os.path.join(directory, "unseeded")
+            (_, rmse_list) = s.get_runs()
+            self.assertEqual(len(set(rmse_list[:, -1])), 3)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_async_oracle(self):
+        for method in ["random", "qbc"]:
+            s = SemiSupervisedBase("housing", method)
+            s.num_iterations = 4
+            random.seed(555)
+            np.random.seed(555)
+            (_, rmse_list) = s.process()
+
+            s = AsyncActiveLearner("housing", method)
+            s.num_iterations = 4
+            s.concurrency = 4
+            target = s.data["target"]
+            oracle = SimulatedOracle(target.copy(), 0.001, 0.001, seed=555)
+            random.seed(555)
+            np.random.seed(555)
+            report = asyncio.run(s.run(oracle))
+            self.assertEqual(report["labeled"], 3 * s.batch_count)
+            self.assertEqual(oracle.count, report["labeled"])
+            self.assertEqual(len(set(s.labeled_pos_list)), 51 + 3 * s.batch_count)
+            self.assertIs(s.data["target"], target)
+            # The model learns from the initial labeled set and every label
+            # that arrived, so it is about as good as the synchronous loop.
+            self.assertLess(report["rmse"], 1.1 * rmse_list[-1])
+
+    def test_service(self):
+        for method in ["random", "greedy", "qbc", "bemcm"]:
+            service = QueryService("housing", method)
+            target = service.learner.data["target"].copy()
+            first = service.next_batch(5)
+            second = service.next_batch(5)
+            self.assertEqual(len(set(first + second)), 10)
+            self.assertFalse(set(first) & set(service.learner.labeled_pos_list))
+            service.add_labels(first, target[first, 0])
+            self.assertEqual(service.get_status()["pending"], 5)
+            self.assertEqual(service.get_status()["labeled"], 51 + 5)
+            # Test, labeled and repeated positions are rejected.
+            for positions in [service.learner.test_pos_list[:1], first[:1], second[:1] * 2]:
+                with self.assertRaises(ValueError):
+                    service.add_labels(positions, target[positions, 0])
+            with self.assertRaises(ValueError):
+                service.add_labels(second[:2], [1.0])
+            self.assertEqual(service.get_status()["labeled"], 51 + 5)
+            # The same seed gives the same split and the same selections.
+            again = QueryService("housing", method)
+            self.assertEqual(again.learner.labeled_pos_list, service.learner.labeled_pos_list[:51])
+            self.assertEqual(again.next_batch(5), first)
+        # Methods the service cannot score are rejected up front.
+        for method in ["qbc2", "bemcm_diverse", "unknown"]:
+            with self.assertRaises(ValueError):
+                QueryService("housing", method)
+
+        server = create_server(QueryService("housing", "qbc"), 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+            connection.request("GET", "/next?count=3")
+            positions = json.loads(connection.getresponse().read())["positions"]
+            self.assertEqual(len(positions), 3)
+            body = json.dumps({"positions": positions, "targets": [1.0, 2.0, 3.0]})
+            connection.request("POST", "/labels", body)
+            self.assertEqual(json.loads(connection.getresponse().read())["labeled"], 54)
+            for body in ["{", json.dumps({"positions": positions, "targets": [1.0, 2.0, 3.0]}),
+                    json.dumps({"positions": [0]})]:
+                connection.request("POST", "/labels", body)
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual(response.status, 400)
+            connection.request("GET", "/next?count=x")
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 400)
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_sparse(self):
+        rng = np.random.RandomState(555)
+        X = rng.rand(50, 6) * (rng.rand(50, 6) < 0.3)
+        y = rng.rand(50, 1)
+        dense = SGDLinear()
+        csr = SGDLinear()
+        for i in range(3):
+            dense.fit(X, y)
+            csr.fit(sparse.csr_matrix(X), y)
+        self.assertTrue(np.allclose(dense.coef, csr.coef))
+        self.assertTrue(np.allclose(dense.predict(X), csr.predict(sparse.csr_matrix(X))))
+
+        for method in ["greedy", "qbc", "bemcm"]:
+            labeled = []
+            for is_sparse in [False, True]:
+                s = SemiSupervisedBase("forestfires", method)
+                s.num_iterations = 4
+                s.precompute_dir = None
+                if is_sparse:
+                    s.data["data"] = sparse.csr_matrix(s.data["data"])
+                random.seed(555)
+                np.random.seed(555)
+                s.process()
+                labeled.append(s.labeled_pos_list)
+            self.assertEqual(labeled[0], labeled[1])
+
+        # The shipped CSR data set scored in several bounded chunks.
+        dense = SemiSupervisedBase("forestfires", "random").data["data"]
+        for method in ["greedy", "qbc", "bemcm"]:
+            labeled = []
+            for name in ["forestfires", "forestfires_sparse"]:
+                s = SemiSupervisedBase(name, method)
+                s.num_iterations = 4
+                s.precompute_dir = None
+                s.sparse_chunk_size = 100
+                random.seed(555)
+                np.random.seed(555)
+                s.process()
+                labeled.append(s.labeled_pos_list)
+            self.assertTrue(sparse.issparse(s.data["data"]))
+            self.assertTrue(np.allclose(s.data["data"].toarray(), dense))
+            self.assertEqual(labeled[0], labeled[1])
+
+    def test_early_stopping(self):
+        s = SemiSupervisedBase("housing", "random")
+        s.num_runs = 2
+        s.precompute_dir = None
+        s.label_budget = 100
+        (percent_list, rmse_list) = s.get_runs()
+        self.assertEqual(s.stop_reasons, ["labels", "labels"])
+        self.assertEqual(rmse_list.shape, (2, 4))
+        self.assertEqual(s.run_lengths, [4, 4])
+        self.assertTrue(len(s.labeled_pos_list) <= 100)
+
+        s = SemiSupervisedBase("housing", "random")
+        s.num_runs = 1
+        s.precompute_dir = None
+        s.plateau_patience = 1
+        s.plateau_tol = 1.0
+        (percent_list, rmse_list) = s.get_runs()
+        self.assertEqual(s.stop_reasons, ["plateau"])
+        self.assertEqual(rmse_list.shape, (1, 2))
+        self.assertEqual(s.run_lengths, [2])
+
+        predictor = SGDLinear()
+        predictor.learning_rate = 0.5
+        predictor.num_epochs = 1000
+        predictor.tol = 1e-4
+        x_train = np.array([[0.3, 0.2], [0.4, 0.8]])
+        y_train = np.array([[0.7], [0.2]])
+        predictor.fit(x_train, y_train)
+        predictor.fit(x_train, y_train)
+        self.assertTrue(predictor.epochs_run < 1000)
+        self.assertTrue(np.allclose(predictor.predict(x_train), y_train, atol=1e-3))
+
+    def test_sweep(self):
+        x_train = np.array([[0.3, 0.2], [0.4, 0.8], [0.1, 0.5]])
+        y_train = np.array([[0.7], [0.2], [0.4]])
+        stacked = StackedSGDLinear([0.01, 0.1])
+        for i in range(2):
+            stacked.fit(x_train, y_train)
+        for (k, learning_rate) in enumerate([0.01, 0.1]):
+            predictor = SGDLinear()
+            predictor.learning_rate = learning_rate
+            for i in range(2):
+                predictor.fit(x_train, y_train)
+            self.assertTrue(np.allclose(stacked.predict(x_train)[:, k], predictor.predict(x_train)))
+
+        sweep = Sweep("housing", ["random", "greedy"], {"learning_rate": [0.001, 0.01], "num_committee": [4],
+            "batch_percent": [0.03], "label_percent": [0.1]})
+        sweep.num_runs = 1
+        sweep.num_iterations = 3
+        jobs = sweep.get_jobs()
+        self.assertEqual(len(jobs), 2)
+        for job in jobs:
+            rows = run_job(job)
+            self.assertEqual(len(rows), 6)
+            for learning_rate in [0.001, 0.01]:
+                single = [row["rmse"] for row in run_job(dict(job, learning_rates=[learning_rate]))]
+                stacked = [row["rmse"] for row in rows if row["learning_rate"] == learning_rate]
+                self.assertTrue(np.allclose(single, stacked))
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            sweep.write(rows, "sweep.txt")
+            self.assertTrue(os.path.isfile("sweep.txt"))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    def test_bootstrap(self):
+        bootstrap = Bootstrap(555)
+        indices = bootstrap.get_indices([3, 5, 7], 4, 6)
+        self.assertEqual(indices.shape, (4, 6))
+        self.assertTrue(set(indices.ravel()) <= set([3, 5, 7]))
+        X = np.arange(20.0).reshape(10, 2)
+        self.assertTrue(np.array_equal(bootstrap.gather("data", X, [1, 1, 4]), X[[1, 1, 4]]))
+
+        rmse = []
+        for i in range(2):
+            s = SemiSupervisedBase("housing", "qbc")
+            s.num_runs = 1
+            s.num_iterations = 3
+            s.bootstrap_mode = "generator"
+            (percent_list, rmse_list) = s.get_runs()
+            rmse.append(rmse_list)
+        self.assertTrue(np.array_equal(rmse[0], rmse[1]))
+
+    def test_evaluator(self):
+        s = SemiSupervisedBase("housing", "qbc")
+        s.num_runs = 2
+        s.num_iterations = 3
+        s.track_committee = True
+        (percent_list, rmse_list) = s.get_runs()
+        self.assertEqual(len(s.committee_rmse_lists), 2)
+        self.assertEqual(s.committee_rmse_lists[1].shape, (3, 2 + s.num_committee))
+        self.assertTrue(np.allclose(s.committee_rmse_lists[1][:, 0], rmse_list[1]))
+        rmse = s.evaluator.evaluate(s.qbc_models)
+        for (k, model) in enumerate(s.qbc_models):
+            self.assertTrue(np.isclose(rmse[k], get_root_mean_squared(s.test_y, model.predict(s.test_X))))
+
+    def test_ingest(self):
+        for name in ["housing", "forestfires", "bike"]:
+            (header, data) = Ingest(name, chunk_rows=100).read()
+            expected = np.genfromtxt("data/{}.txt".format(name), delimiter="\t", skip_header=1)
+            self.assertTrue(np.array_equal(data, expected))
+            with open("data/{}.txt".format(name), "r") as infile:
+                self.assertEqual(header, infile.readline().strip("\n").split("\t"))
+
+    def test_batch(self):
+        jobs = [("housing", method, run) for method in ["qbc", "random"] for run in range(2)]
+        self.assertEqual(sorted(job for batch in pack(jobs, 3) for job in batch), sorted(jobs))
+        results = run_batch(jobs, 3)
+        for method in ["qbc", "random"]:
+            s = SemiSupervisedBase("housing", method)
+            s.num_runs = 2
+            s.num_iterations = 3
+            (percent_list, rmse_list) = s.get_runs()
+            rmse = [result["rmse"] for result in results if result["method"] == method]
+            self.assertTrue(np.array_equal(rmse, rmse_list))
+
     def test_upper(self):
         self.assertEqual('foo'.upper(), 'FOO')
 